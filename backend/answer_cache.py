@@ -0,0 +1,153 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import time
+from typing import Any
+
+import numpy as np
+
+MANIFEST_PATH = Path(os.getenv("INGEST_MANIFEST_PATH", Path(__file__).parent.parent / "data" / ".ingest_manifest.json"))
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!. ").lower()
+
+
+def corpus_version(manifest_path: Path = MANIFEST_PATH) -> str:
+    """Version of the ingested corpus - changes every time ingestion writes a new manifest (of any collection)"""
+    manifests = sorted(manifest_path.parent.glob(f"{manifest_path.stem}*{manifest_path.suffix}"))
+    if not manifests:
+        return "unknown"
+    digest = hashlib.sha256()
+    try:
+        for path in manifests:
+            digest.update(path.read_bytes())
+    except OSError:
+        return "unknown"
+    return digest.hexdigest()[:16]
+
+
+@dataclass
+class CacheEntry:
+    model: str
+    corpus_version: str
+    embedding: np.ndarray
+    response: Any
+    created_at: float = field(default_factory=time)
+
+
+class AnswerCache:
+    """
+    Cache of generated answers, looked up before running Qdrant search and generation.
+
+    Two tiers:
+      - exact: normalized query text + model + corpus version
+      - semantic: the closest cached query of the same model and corpus version, if its cosine
+        similarity with the new query is at least `similarity_threshold`
+
+    Entries are evicted in LRU order above `max_entries` and expire after `ttl` seconds.
+    When the corpus version changes (new ingestion), all entries of older versions are dropped.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl: float = 3600,
+        similarity_threshold: float = 0.95,
+        version_check_interval: float = 10
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.version_check_interval = version_check_interval
+        self._entries: OrderedDict[tuple[str, str, str], CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._corpus_version = corpus_version()
+        self._version_checked_at = time()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _current_version(self) -> str:
+        now = time()
+        if now - self._version_checked_at >= self.version_check_interval:
+            self._version_checked_at = now
+            version = corpus_version()
+            if version != self._corpus_version:
+                print(f"Corpus changed ({self._corpus_version} -> {version}), clearing answer cache")
+                self.stats["invalidations"] += 1
+                self._entries.clear()
+                self._corpus_version = version
+        return self._corpus_version
+
+    def _expired(self, entry: CacheEntry) -> bool:
+        return time() - entry.created_at > self.ttl
+
+    @staticmethod
+    def _normalize_embedding(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def get(self, query: str, model: str, embedding: np.ndarray | None = None) -> Any | None:
+        with self._lock:
+            version = self._current_version()
+            key = (normalize_query(query), model, version)
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry):
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry.response
+
+            if embedding is not None:
+                candidates = [
+                    (candidate_key, candidate) for candidate_key, candidate in self._entries.items()
+                    if candidate.model == model and candidate.corpus_version == version and not self._expired(candidate)
+                ]
+                if candidates:
+                    matrix = np.stack([candidate.embedding for _, candidate in candidates])
+                    similarities = matrix @ self._normalize_embedding(embedding)
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.similarity_threshold:
+                        best_key, best_entry = candidates[best]
+                        self._entries.move_to_end(best_key)
+                        self.stats["semantic_hits"] += 1
+                        return best_entry.response
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, query: str, model: str, embedding: np.ndarray, response: Any) -> None:
+        with self._lock:
+            version = self._current_version()
+            key = (normalize_query(query), model, version)
+            self._entries[key] = CacheEntry(
+                model=model,
+                corpus_version=version,
+                embedding=self._normalize_embedding(embedding),
+                response=response
+            )
+            self._entries.move_to_end(key)
+            expired = [entry_key for entry_key, entry in self._entries.items() if self._expired(entry)]
+            for entry_key in expired:
+                del self._entries[entry_key]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.stats["exact_hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+            hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+            return {
+                **self.stats,
+                "size": len(self._entries),
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "corpus_version": self._corpus_version,
+            }
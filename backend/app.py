@@ -1,61 +1,274 @@
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-import ollama
-import concurrent.futures
-from .rag import rag, evaluate_relevance, clean_qwen_response
-from .db import save_conversation
+import asyncio
+import json
 import os
+from .rag import rag_async, rag_stream, rag_batch, ThinkStripper
+from .qdrant_connector import SearchFilter
+from .db import get_conversation_logger, migrate_db, shutdown_db
+from .evaluation import EvaluationScheduler
+from . import registry
+from . import metrics
+from datetime import datetime
 from time import time
+from typing import Literal
 
-OLLAMA_HOST = os.getenv("OLLAMA_HOST")
-OLLAMA_PORT = os.getenv("OLLAMA_PORT")
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 360))
+DISCONNECT_POLL_INTERVAL = 0.5
+ASK_BATCH_MAX_QUESTIONS = int(os.getenv("ASK_BATCH_MAX_QUESTIONS", 1000))
+ASK_BATCH_CONCURRENCY = int(os.getenv("ASK_BATCH_CONCURRENCY", 4))
 
-ollama_host = f"http://{OLLAMA_HOST}:{OLLAMA_PORT}"
+class Filters(BaseModel):
+    """Only search chunks of these files / overlapping the page range / ingested in the time range / with any of the tags"""
+    file_names: list[str] | None = None
+    page_from: int | None = None
+    page_to: int | None = None
+    ingested_after: datetime | None = None
+    ingested_before: datetime | None = None
+    tags: list[str] | None = None
 
-client = ollama.Client(host=ollama_host)
+    def to_search_filter(self) -> SearchFilter:
+        return SearchFilter(
+            file_names=tuple(self.file_names) if self.file_names is not None else None,
+            page_from=self.page_from,
+            page_to=self.page_to,
+            ingested_after=int(self.ingested_after.timestamp()) if self.ingested_after else None,
+            ingested_before=int(self.ingested_before.timestamp()) if self.ingested_before else None,
+            tags=tuple(self.tags) if self.tags is not None else None,
+        )
 
 class Prompt(BaseModel):
     model: str
     text: str
+    retrieval_mode: Literal["dense", "hybrid"] | None = None  # RETRIEVAL_MODE when not set
+    filters: Filters | None = None
+
+class BatchPrompt(BaseModel):
+    model: str
+    questions: list[str]
+    retrieval_mode: Literal["dense", "hybrid"] | None = None
+    concurrency: int | None = None  # ASK_BATCH_CONCURRENCY when not set
+    filters: Filters | None = None
+    evaluate: bool = False  # queue the answers for relevance evaluation
 
 app = FastAPI()
 
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+evaluation_scheduler = EvaluationScheduler()
+
+metrics.register(metrics.Gauge(
+    "evaluation_queue_depth", "Answers waiting for relevance evaluation",
+    lambda: evaluation_scheduler.get_stats()["queue_depth"]
+))
+metrics.register(metrics.Gauge(
+    "conversation_log_queue_depth", "Conversations waiting to be written to the database",
+    lambda: get_conversation_logger().get_stats()["queue_depth"]
+))
+metrics.register(metrics.Gauge(
+    "ollama_in_flight", "Generations running against the Ollama instances",
+    lambda: sum(node["in_flight"] for node in registry.get_llm_router().get_stats()["nodes"].values())
+))
+metrics.register(metrics.Gauge(
+    "ollama_healthy_nodes", "Ollama instances passing the health check",
+    lambda: sum(node["healthy"] for node in registry.get_llm_router().get_stats()["nodes"].values())
+))
 
-def chained_background_tasks(query: str, response: str, model: str, response_time: float):
-    """Run evaluate_relevance first, then save_conversations with the result"""
+async def run_while_connected(request: Request, coro, timeout: float):
+    """Await coro, cancelling it when the client disconnects or the timeout passes"""
+    task = asyncio.create_task(coro)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
     try:
-        print("Evaluating relevance of the answer in background task")
-        cleaned_response = clean_qwen_response(response.response)
-        relevance_result = evaluate_relevance(query, cleaned_response, model)
-
-        answer_data = {
-            "answer": cleaned_response.strip(),
-            "model_used": model,
-            "response_time": response_time,
-            "relevance": relevance_result.get("Relevance", "UNKNOWN"),
-            "relevance_explanation": relevance_result.get("Explanation", "No explanation provided"),
-        }
-        
-        print("Saving conversation to the database")
-        save_conversation(query, answer_data)
-        
-    except Exception as e:
-        print(f"Error in background tasks: {e}")
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                print("Client disconnected, cancelling request")
+                raise HTTPException(status_code=499, detail="Client disconnected")
+            if loop.time() > deadline:
+                raise HTTPException(status_code=504, detail="Request timed out")
+    finally:
+        task.cancel()
+
+def search_filter(filters: Filters | None) -> SearchFilter | None:
+    return filters.to_search_filter() if filters is not None else None
+
+def answer(prompt: Prompt):
+    """rag_async() for the prompt, shared with identical questions in flight"""
+    def compute():
+        return rag_async(
+            query=prompt.text, model=prompt.model, retrieval_mode=prompt.retrieval_mode,
+            search_filter=search_filter(prompt.filters)
+        )
+    coalescer = registry.get_request_coalescer()
+    if coalescer is None:
+        return compute()
+    key = coalescer.key(prompt.text, prompt.model, prompt.retrieval_mode, search_filter(prompt.filters))
+    return coalescer.run(key, compute)
+
+def answer_stream(prompt: Prompt):
+    """rag_stream() for the prompt, shared with identical questions in flight"""
+    def compute():
+        return rag_stream(
+            query=prompt.text, model=prompt.model, retrieval_mode=prompt.retrieval_mode,
+            search_filter=search_filter(prompt.filters)
+        )
+    coalescer = registry.get_request_coalescer()
+    if coalescer is None:
+        return compute()
+    key = coalescer.key(prompt.text, prompt.model, prompt.retrieval_mode, search_filter(prompt.filters))
+    return coalescer.stream(key, compute)
 
 @app.get("/healthcheck")
 def read_root():
     return {"message": "Hello, FastAPI!"}
 
+@app.get("/readiness")
+def readiness():
+    status = registry.status()
+    return JSONResponse(content=status, status_code=200 if status["ready"] else 503)
+
+@app.get("/cache/stats")
+def cache_stats():
+    answer_cache = registry.get_answer_cache()
+    qdrant_connector = registry.get_qdrant_connector()
+    embedding_cache = qdrant_connector.embedding_cache
+    query_batcher = qdrant_connector.query_batcher
+    reranker = registry.get_reranker()
+    coalescer = registry.get_request_coalescer()
+    return {
+        "answers": answer_cache.get_stats() if answer_cache else {"enabled": False},
+        "query_embeddings": embedding_cache.get_stats() if embedding_cache else {"enabled": False},
+        "query_batching": query_batcher.get_stats() if query_batcher else {"enabled": False},
+        "rerank_scores": reranker.get_stats() if reranker else {"enabled": False},
+        "coalescing": coalescer.get_stats() if coalescer else {"enabled": False},
+    }
+
+@app.get("/db/stats")
+def db_stats():
+    return get_conversation_logger().get_stats()
+
+@app.get("/evaluation/stats")
+def evaluation_stats():
+    return evaluation_scheduler.get_stats()
+
+@app.get("/llm/stats")
+def llm_stats():
+    return registry.get_llm_router().get_stats()
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.post("/ask")
-def llm(prompt: Prompt):
+async def llm(prompt: Prompt, request: Request):
     start = time()
-    response = rag(query=prompt.text, model=prompt.model)
+    with evaluation_scheduler.user_request(), metrics.track_request(prompt.model) as timings:
+        response = await run_while_connected(request, answer(prompt), REQUEST_TIMEOUT)
     end = time()
     response_time = end - start
-    executor.submit(chained_background_tasks, prompt.text, response, prompt.model, response_time)
+    timings.record("total", response_time)
+    metrics.requests_total.inc(model=prompt.model, endpoint="/ask")
+    # a cached answer was evaluated when it was generated, a coalesced one by the request generating it
+    evaluation_scheduler.submit(
+        prompt.text, response.response, prompt.model, response_time, timings=timings.as_dict(),
+        evaluate=not (timings.cached or timings.coalesced)
+    )
     return response
 
+@app.post("/ask/stream")
+async def llm_stream(prompt: Prompt):
+    """
+    Stream the answer as NDJSON: {"token": ...} lines while generating (with <think> blocks removed),
+    then a final {"done": true, "response_time": ..., "first_token_time": ...} line
+    """
+    async def generate():
+        start = time()
+        first_token_time = None
+        answer_parts = []
+        think_stripper = ThinkStripper()
+
+        def token_line(text: str) -> str:
+            nonlocal first_token_time
+            if first_token_time is None:
+                first_token_time = time() - start
+            answer_parts.append(text)
+            return json.dumps({"token": text}) + "\n"
+
+        try:
+            with evaluation_scheduler.user_request(), metrics.track_request(prompt.model) as timings:
+                tokens = answer_stream(prompt)
+                async for token in tokens:
+                    if text := think_stripper.feed(token):
+                        yield token_line(text)
+                if text := think_stripper.flush():
+                    yield token_line(text)
+        except Exception as e:
+            print(f"Error while streaming answer: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
+            return
+
+        response_time = time() - start
+        timings.record("total", response_time)
+        metrics.requests_total.inc(model=prompt.model, endpoint="/ask/stream")
+        yield json.dumps({"done": True, "response_time": response_time, "first_token_time": first_token_time}) + "\n"
+        evaluation_scheduler.submit(
+            prompt.text, "".join(answer_parts), prompt.model, response_time, first_token_time, timings.as_dict(),
+            evaluate=not (timings.cached or timings.coalesced)
+        )
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.post("/ask_batch")
+async def llm_batch(prompt: BatchPrompt):
+    """
+    Answer many questions in one job, streamed as NDJSON: one line per question as soon as it's answered
+    ({"index", "question", "answer", "cached", "response_time", "timings"}, or {"index", "question", "error"}),
+    then a final {"done": true, "count": ..., "errors": ..., "total_time": ...} line
+    """
+    if not prompt.questions:
+        raise HTTPException(status_code=422, detail="No questions")
+    if len(prompt.questions) > ASK_BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {ASK_BATCH_MAX_QUESTIONS} questions per batch")
+
+    async def generate():
+        start = time()
+        errors = 0
+        with evaluation_scheduler.user_request():
+            items = rag_batch(
+                prompt.questions, prompt.model, prompt.retrieval_mode, prompt.concurrency or ASK_BATCH_CONCURRENCY,
+                search_filter(prompt.filters)
+            )
+            try:
+                async for item in items:
+                    if "error" in item:
+                        errors += 1
+                    else:
+                        metrics.requests_total.inc(model=prompt.model, endpoint="/ask_batch")
+                        if prompt.evaluate:
+                            evaluation_scheduler.submit(
+                                item["question"], item["answer"], prompt.model, item["response_time"],
+                                timings=item["timings"], evaluate=not item["cached"]
+                            )
+                    yield json.dumps(item) + "\n"
+            except Exception as e:
+                print(f"Error while answering batch: {e}")
+                yield json.dumps({"error": str(e)}) + "\n"
+                return
+        yield json.dumps({
+            "done": True, "count": len(prompt.questions), "errors": errors, "total_time": time() - start
+        }) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.on_event("startup")
+def startup_event():
+    migrate_db()
+    registry.warm_up()
+
 @app.on_event("shutdown")
 def shutdown_event():
-    executor.shutdown(wait=True)
\ No newline at end of file
+    evaluation_scheduler.stop(timeout=30)
+    shutdown_db(timeout=30)
+    registry.shut_down()
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""
+Answer a whole question set with one /ask_batch request.
+
+Reads the questions from a CSV with a "question" column (notebooks/sample_questions.csv by
+default), sends them to /ask_batch and writes the answers as they stream back: NDJSON with
+per-question timings, or CSV (id, question, answer, response_time) when --output ends with .csv.
+Prints a summary with the total time and throughput at the end.
+
+Usage:
+    python backend/ask_batch.py --model qwen3:1.7b --output answers.ndjson
+    python backend/ask_batch.py --model qwen3 --concurrency 8 --evaluate --output answers.csv
+    python backend/ask_batch.py --model qwen3 --file-name program.pdf --output answers.ndjson
+"""
+import argparse
+import csv
+import json
+import sys
+from pathlib import Path
+from time import perf_counter
+
+import httpx
+
+QUESTIONS_PATH = Path(__file__).parent.parent / "notebooks" / "sample_questions.csv"
+
+
+def load_questions(path: Path) -> list[dict]:
+    with open(path, newline="") as f:
+        return [row for row in csv.DictReader(f) if row.get("question")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a question set with the backend /ask_batch endpoint")
+    parser.add_argument("--url", default="http://localhost:8000", help="Backend base URL")
+    parser.add_argument("--model", default="qwen3:1.7b")
+    parser.add_argument("--questions", type=Path, default=QUESTIONS_PATH, help="CSV with a 'question' column")
+    parser.add_argument("--retrieval-mode", choices=["dense", "hybrid"], help="Backend default when not set")
+    parser.add_argument("--concurrency", type=int, help="Concurrent generations, backend default when not set")
+    parser.add_argument("--evaluate", action="store_true", help="Queue the answers for relevance evaluation")
+    parser.add_argument("--file-name", action="append", help="Only search this PDF (repeatable)")
+    parser.add_argument("--tag", action="append", help="Only search PDFs with this tag (repeatable)")
+    parser.add_argument("--output", type=Path, help="NDJSON, or CSV when it ends with .csv (default: stdout NDJSON)")
+    parser.add_argument("--timeout", type=float, default=3600)
+    args = parser.parse_args()
+
+    rows = load_questions(args.questions)
+    body = {
+        "model": args.model,
+        "questions": [row["question"] for row in rows],
+        "retrieval_mode": args.retrieval_mode,
+        "concurrency": args.concurrency,
+        "evaluate": args.evaluate,
+        "filters": {"file_names": args.file_name, "tags": args.tag} if args.file_name or args.tag else None,
+    }
+    items: list[dict] = []
+    summary = {}
+    start = perf_counter()
+    with httpx.stream("POST", f"{args.url}/ask_batch", json=body, timeout=args.timeout) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            item = json.loads(line)
+            if item.get("done") or "index" not in item:
+                summary = item
+                continue
+            items.append(item)
+            if args.output is None:
+                print(line)
+            status = "error" if "error" in item else f"{item['response_time']:.1f}s"
+            print(f"[{len(items)}/{len(rows)}] question {item['index']}: {status}", file=sys.stderr)
+    elapsed = perf_counter() - start
+
+    items.sort(key=lambda item: item["index"])
+    if args.output is not None and args.output.suffix == ".csv":
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["id", "question", "answer", "response_time", "error"])
+            writer.writeheader()
+            for item in items:
+                writer.writerow({
+                    "id": rows[item["index"]].get("id", item["index"]),
+                    "question": item["question"],
+                    "answer": item.get("answer"),
+                    "response_time": item.get("response_time"),
+                    "error": item.get("error"),
+                })
+    elif args.output is not None:
+        with open(args.output, "w") as f:
+            for item in items:
+                f.write(json.dumps(item) + "\n")
+
+    answered = sum("error" not in item for item in items)
+    print(json.dumps({
+        "questions": len(rows),
+        "answered": answered,
+        "cached": sum(bool(item.get("cached")) for item in items),
+        "errors": len(items) - answered,
+        "total_time_s": elapsed,
+        "questions_per_s": len(items) / elapsed if elapsed else 0.0,
+        "server": summary,
+    }, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
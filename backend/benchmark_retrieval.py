@@ -0,0 +1,301 @@
+"""
+Offline retrieval benchmark.
+
+Ingests the PDFs from data/ into an embedded Qdrant (no services needed) with the real backend
+classes, for every combination of connector, embedding model and chunk size, then runs the
+questions against it and reports hit-rate, MRR, ingestion throughput, query latency and memory.
+With --qdrant-host the dense connector runs against a Qdrant server instead, where
+--quantizations / --vector-datatypes / --on-disk show the recall (vs exact search), memory and
+latency tradeoff of quantized and reduced precision vectors.
+
+Ground truth is taken from the questions CSV, which needs a "question" column and at least one of:
+    - relevant_text: a fragment that has to appear in a relevant chunk
+    - file_name (+ optional page): the document (and page) the answer is in
+Without those columns use --synthetic N, which samples N chunks and queries with a sentence of each,
+the chunk it was taken from being the relevant one.
+
+Usage:
+    python backend/benchmark_retrieval.py --chunk-sizes 500,800 --connectors dense,hybrid --output results.json
+    python backend/benchmark_retrieval.py --synthetic 100 --qdrant-host localhost --quantizations none,scalar,binary
+"""
+import argparse
+import csv
+import json
+import random
+import re
+import resource
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+from pdf_extraction import PDFExtractor
+from pdf_to_qdrant import PDFToQdrant
+from qdrant_connector import QdrantConnector
+from qdrant_connector_hybrid import QdrantConnectorHybrid
+
+BASE_PATH = Path(__file__).parent.parent
+DATA_PATH = BASE_PATH / "data"
+QUESTIONS_PATH = BASE_PATH / "notebooks" / "sample_questions.csv"
+DENSE_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+HYBRID_MODEL = "jinaai/jina-embeddings-v2-small-en"
+
+
+def rss_mb() -> float:
+    """Current resident memory of the process, falls back to peak RSS outside of Linux"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    values_ms = np.array(values) * 1000
+    return {
+        "p50_ms": float(np.percentile(values_ms, 50)),
+        "p95_ms": float(np.percentile(values_ms, 95)),
+        "p99_ms": float(np.percentile(values_ms, 99)),
+        "mean_ms": float(values_ms.mean()),
+    }
+
+
+def load_questions(path: Path) -> list[dict]:
+    with open(path, newline="") as f:
+        questions = list(csv.DictReader(f))
+    if not questions:
+        raise SystemExit(f"{path} has no questions")
+    if not {"relevant_text", "file_name"} & set(questions[0]):
+        raise SystemExit(
+            f"{path} has no ground truth columns (relevant_text or file_name[, page]), "
+            "add them or run with --synthetic N"
+        )
+    return questions
+
+
+def synthetic_questions(connector, count: int, seed: int) -> list[dict]:
+    """Sample chunks from the collection and use one sentence of each as a query"""
+    payloads = connector.scroll_payloads(limit=10_000)
+    rng = random.Random(seed)
+    questions = []
+    for payload in rng.sample(payloads, min(count, len(payloads))):
+        sentences = [s.strip() for s in re.split(r"[.\n]", payload["text"]) if len(s.strip()) > 30]
+        if sentences:
+            sentence = rng.choice(sentences)
+            questions.append({"question": sentence, "relevant_text": sentence})
+    return questions
+
+
+def is_relevant(result: dict, question: dict) -> bool:
+    if question.get("relevant_text"):
+        return question["relevant_text"].strip().lower() in result["text"].lower()
+    if question.get("file_name") and result.get("file_name") != question["file_name"]:
+        return False
+    if question.get("page"):
+        page = int(question["page"])
+        page_start, page_end = result.get("page_start"), result.get("page_end")
+        if page_start is None or not page_start <= page <= (page_end or page_start):
+            return False
+    return True
+
+
+def build_connector(connector_type: str, embedding_model: str, qdrant_location: str, chunk_size: int, args,
+                    quantization: str | None = None, vector_datatype: str = "float32"):
+    if connector_type in ("dense", "numpy"):
+        # "numpy" is the dense connector on the in-process NumpyVectorIndex instead of Qdrant
+        if connector_type == "numpy":
+            storage = {"vector_index_path": tempfile.mkdtemp(prefix="vector_index_benchmark_")}
+        elif args.qdrant_host:
+            storage = {"qdrant_host": args.qdrant_host, "qdrant_port": args.qdrant_port, "prefer_grpc": args.prefer_grpc}
+        else:
+            storage = {"qdrant_location": qdrant_location}
+        connector = QdrantConnector(
+            embedding_model=embedding_model,
+            collection_name=f"benchmark_{chunk_size}",
+            quantization=quantization,
+            on_disk=args.on_disk,
+            vector_datatype=vector_datatype,
+            **storage
+        )
+        connector.recreate_collection()
+        return connector
+    if connector_type == "hybrid":
+        connector = QdrantConnectorHybrid(
+            embedding_model=embedding_model,
+            collection_name=f"benchmark_hybrid_{chunk_size}",
+            fusion=args.fusion,
+            qdrant_location=qdrant_location
+        )
+        connector.recreate_collection()
+        return connector
+    raise ValueError(f"Unknown connector type: {connector_type}")
+
+
+def vector_memory_mb(connector, points: int) -> dict | None:
+    """Estimated size of stored vectors: originals and their quantized copies"""
+    if not isinstance(connector, QdrantConnector):
+        return None
+    dimension = connector.embedding_model.get_sentence_embedding_dimension()
+    original = points * dimension * (2 if connector.vector_datatype == "float16" else 4)
+    quantized = {"scalar": points * dimension, "binary": points * dimension / 8}.get(connector.quantization, 0)
+    # with on_disk the originals are only read for rescoring, RAM holds the quantized vectors
+    in_ram = quantized if connector.on_disk and quantized else original + quantized
+    return {
+        "original_mb": original / 2**20,
+        "quantized_mb": quantized / 2**20,
+        "in_ram_mb": in_ram / 2**20,
+    }
+
+
+def result_key(result: dict) -> tuple:
+    return result.get("file_name"), result.get("chunk_index"), result["text"]
+
+
+def run_config(
+    args, connector_type: str, embedding_model: str, chunk_size: int, pdf_files: list[Path],
+    questions: list[dict] | None, quantization: str | None = None, vector_datatype: str = "float32"
+) -> dict:
+    print(f"=== {connector_type} | {embedding_model} | chunk_size={chunk_size} | quantization={quantization} | {vector_datatype}")
+    # every config gets a fresh embedded Qdrant, in memory or in a temporary directory
+    qdrant_dir = None if args.in_memory else tempfile.mkdtemp(prefix="qdrant_benchmark_")
+    rss_before = rss_mb()
+    connector = None
+    try:
+        connector = build_connector(
+            connector_type, embedding_model, qdrant_dir or ":memory:", chunk_size, args, quantization, vector_datatype
+        )
+        processor = PDFToQdrant(connector, PDFExtractor(workers=args.extract_workers))
+
+        start = perf_counter()
+        chunks = 0
+        for pdf_path, result in processor.process_pdfs(pdf_files, chunk_size=chunk_size, overlap=args.overlap):
+            if isinstance(result, int):
+                chunks += result
+            else:
+                print(f"Failed to ingest {pdf_path}: {result}")
+        ingest_seconds = perf_counter() - start
+
+        if questions is None:
+            questions = synthetic_questions(connector, args.synthetic, args.seed)
+
+        latencies, hits, reciprocal_ranks, recalls = [], 0, [], []
+        for question in questions:
+            for repeat in range(args.repeat):
+                start = perf_counter()
+                results = connector.search_similar(question["question"], limit=args.limit)
+                latencies.append(perf_counter() - start)
+            rank = next((i for i, result in enumerate(results, start=1) if is_relevant(result, question)), None)
+            hits += rank is not None
+            reciprocal_ranks.append(1 / rank if rank else 0.0)
+            if isinstance(connector, QdrantConnector):
+                # how much of the exact float32 top-k the index / quantized search finds
+                exact = connector.search_similar(question["question"], limit=args.limit, exact=True)
+                if exact:
+                    found = {result_key(result) for result in results}
+                    recalls.append(sum(result_key(result) in found for result in exact) / len(exact))
+
+        return {
+            "connector": connector_type,
+            "embedding_model": embedding_model,
+            "quantization": quantization,
+            "vector_datatype": vector_datatype,
+            "on_disk": args.on_disk,
+            "chunk_size": chunk_size,
+            "overlap": args.overlap,
+            "limit": args.limit,
+            "questions": len(questions),
+            "hit_rate": hits / len(questions) if questions else None,
+            "mrr": float(np.mean(reciprocal_ranks)) if reciprocal_ranks else None,
+            "recall_vs_exact": float(np.mean(recalls)) if recalls else None,
+            "ingestion": {
+                "chunks": chunks,
+                "seconds": ingest_seconds,
+                "chunks_per_second": chunks / ingest_seconds if ingest_seconds else None,
+            },
+            "query_latency": percentiles(latencies),
+            "memory": {
+                "rss_mb": rss_mb(),
+                "rss_delta_mb": rss_mb() - rss_before,
+                "vectors": vector_memory_mb(connector, chunks),
+            },
+        }
+    finally:
+        if args.qdrant_host and isinstance(connector, QdrantConnector) and connector.qdrant_client is not None:
+            connector.qdrant_client.delete_collection(connector.collection_name)
+        if qdrant_dir:
+            shutil.rmtree(qdrant_dir, ignore_errors=True)
+        if connector_type == "numpy" and connector is not None:
+            shutil.rmtree(connector.vector_index.path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark")
+    parser.add_argument("--questions", default=str(QUESTIONS_PATH), help="CSV with questions and ground truth")
+    parser.add_argument("--synthetic", type=int, default=0, help="Generate N questions from sampled chunks")
+    parser.add_argument("--data-dir", default=str(DATA_PATH))
+    parser.add_argument("--connectors", default="dense", help="Comma separated: dense,numpy,hybrid")
+    parser.add_argument("--models", default="", help="Comma separated embedding models (default per connector)")
+    parser.add_argument("--chunk-sizes", default="800")
+    parser.add_argument("--overlap", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=1, help="Run every query N times for latency stats")
+    parser.add_argument("--extract-workers", type=int, default=None)
+    parser.add_argument("--in-memory", action="store_true", help="Use Qdrant ':memory:' instead of path mode")
+    parser.add_argument("--qdrant-host", default=None, help="Benchmark the dense connector against a Qdrant server")
+    parser.add_argument("--qdrant-port", type=int, default=6333)
+    parser.add_argument("--prefer-grpc", action="store_true", help="Talk to the Qdrant server over gRPC")
+    parser.add_argument("--quantizations", default="none", help="Comma separated: none,scalar,binary (dense connector)")
+    parser.add_argument("--vector-datatypes", default="float32", help="Comma separated: float32,float16 (dense connector)")
+    parser.add_argument("--on-disk", action="store_true", help="Keep original vectors on disk (dense connector)")
+    parser.add_argument("--fusion", default="rrf", help="rrf or dbsf (hybrid connector)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    pdf_files = sorted(Path(args.data_dir).glob("*.pdf"))
+    if not pdf_files:
+        raise SystemExit(f"No PDFs found in {args.data_dir}")
+    # check the ground truth before spending minutes on ingestion, synthetic questions need the chunks
+    questions = None if args.synthetic else load_questions(Path(args.questions))
+
+    quantizations = [None if name == "none" else name for name in args.quantizations.split(",")]
+    vector_datatypes = args.vector_datatypes.split(",")
+    if not args.qdrant_host and (quantizations != [None] or vector_datatypes != ["float32"] or args.on_disk):
+        print("Warning: embedded Qdrant ignores quantization and storage options, use --qdrant-host to measure them")
+
+    results = []
+    for connector_type in args.connectors.split(","):
+        models = args.models.split(",") if args.models else [HYBRID_MODEL if connector_type == "hybrid" else DENSE_MODEL]
+        storage_configs = [
+            (quantization, datatype) for quantization in quantizations for datatype in vector_datatypes
+        ] if connector_type == "dense" else [(None, "float32")]
+        for embedding_model in models:
+            for chunk_size in (int(size) for size in args.chunk_sizes.split(",")):
+                for quantization, vector_datatype in storage_configs:
+                    results.append(run_config(
+                        args, connector_type, embedding_model, chunk_size, pdf_files, questions, quantization,
+                        vector_datatype
+                    ))
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "files": [pdf.name for pdf in pdf_files],
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+        print(f"Results written to {args.output}")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+from bisect import bisect_right
+from typing import Any, Iterable, Iterator
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+
+def get_sentence_splitter(chunk_size: int, overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,     # Number of characters per chunk
+        chunk_overlap=overlap,   # Overlap to maintain context
+        separators=["\n\n", "\n", ".", " ", ""],  # Prioritize splitting on paragraph, newline, and sentence boundaries
+        add_start_index=True
+    )
+
+
+def chunk_pages(
+    pages: Iterable[str],
+    chunk_size: int,
+    overlap: int,
+    window_pages: int = 4
+) -> Iterator[dict[str, Any]]:
+    """
+    Split a stream of pages into chunks without joining the whole document.
+
+    Pages are appended to a buffer that is split once it holds at least `window_pages` pages
+    and 4 * chunk_size characters. All chunks but the last are emitted; the buffer then restarts at
+    the last chunk, so overlap is carried across page boundaries and only a window of pages
+    is kept in memory.
+
+    Yields dicts with "text", "page_start", "page_end" (1-based, inclusive) and
+    "char_start", "char_end" (offsets in the document, as if pages were joined with "\\n").
+    """
+    splitter = get_sentence_splitter(chunk_size, overlap)
+    buffer = ""
+    buffer_offset = 0           # document offset of buffer[0]
+    page_offsets: list[int] = []  # document offsets where buffered pages start
+    page_numbers: list[int] = []
+    buffered_pages = 0
+
+    def page_at(offset: int) -> int:
+        return page_numbers[max(bisect_right(page_offsets, offset) - 1, 0)]
+
+    def split(final: bool) -> Iterator[dict[str, Any]]:
+        nonlocal buffer, buffer_offset, page_offsets, page_numbers, buffered_pages
+        documents = splitter.create_documents([buffer])
+        if not final:
+            if len(documents) < 2:
+                return
+            documents, carried = documents[:-1], documents[-1]
+        for document in documents:
+            char_start = buffer_offset + document.metadata["start_index"]
+            char_end = char_start + len(document.page_content)
+            yield {
+                "text": document.page_content,
+                "page_start": page_at(char_start),
+                "page_end": page_at(char_end - 1),
+                "char_start": char_start,
+                "char_end": char_end,
+            }
+        if final:
+            return
+        cut = carried.metadata["start_index"]
+        buffer = buffer[cut:]
+        buffer_offset += cut
+        first_page = max(bisect_right(page_offsets, buffer_offset) - 1, 0)
+        page_offsets = page_offsets[first_page:]
+        page_numbers = page_numbers[first_page:]
+        buffered_pages = len(page_offsets)
+
+    for page_number, page in enumerate(pages, start=1):
+        page_offsets.append(buffer_offset + len(buffer))
+        page_numbers.append(page_number)
+        buffer += page + "\n"
+        buffered_pages += 1
+        if buffered_pages >= window_pages and len(buffer) >= 4 * chunk_size:
+            yield from split(final=False)
+    if buffer.strip():
+        yield from split(final=True)
@@ -0,0 +1,129 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
+from .answer_cache import normalize_query
+from .metrics import coalesced_requests, record_coalesced
+
+T = TypeVar("T")
+
+
+class _Flight:
+    """One in-flight computation and the number of requests waiting for it"""
+
+    def __init__(self):
+        self.task: asyncio.Task | None = None
+        self.waiters = 0
+        # streams only: the parts produced so far, replayed to requests that join late
+        self.parts: list[str] = []
+        self.done = False
+        self.error: Exception | None = None
+        self.updated = asyncio.Event()
+
+    def notify(self) -> None:
+        self.updated.set()
+        self.updated = asyncio.Event()
+
+
+class RequestCoalescer:
+    """
+    Single-flight coalescing of identical concurrent questions.
+
+    Requests with the same key (normalized query, model, retrieval mode, filter) arriving while one
+    is being answered wait for that computation instead of starting their own, and all get
+    its result, or all of its token stream. The computation is cancelled only when every
+    request waiting for it is gone. Runs on one event loop, so no locking is needed.
+    """
+
+    def __init__(self):
+        self._flights: dict[tuple, _Flight] = {}
+        self._streams: dict[tuple, _Flight] = {}
+        self.stats = {"computed": 0, "coalesced": 0, "streams_computed": 0, "streams_coalesced": 0}
+
+    @staticmethod
+    def key(query: str, model: str, retrieval_mode: str | None, search_filter=None) -> tuple:
+        if search_filter is not None and search_filter.is_empty():
+            search_filter = None
+        return normalize_query(query), model, retrieval_mode, search_filter
+
+    @staticmethod
+    def _join(flights: dict[tuple, _Flight], key: tuple) -> tuple[_Flight, bool]:
+        flight = flights.get(key)
+        # a finished flight stays in the dict until its done callback runs
+        if flight is not None and not flight.done and not flight.task.done():
+            return flight, False
+        flight = flights[key] = _Flight()
+        return flight, True
+
+    @staticmethod
+    def _leave(flights: dict[tuple, _Flight], key: tuple, flight: _Flight) -> None:
+        flight.waiters -= 1
+        if not flight.waiters and not flight.task.done():
+            flight.task.cancel()
+            # new requests must not join a computation that is being cancelled
+            if flights.get(key) is flight:
+                del flights[key]
+
+    @staticmethod
+    def _forget_when_done(flights: dict[tuple, _Flight], key: tuple, flight: _Flight) -> None:
+        def forget(_):
+            if flights.get(key) is flight:
+                del flights[key]
+        flight.task.add_done_callback(forget)
+
+    async def run(self, key: tuple, compute: Callable[[], Awaitable[T]]) -> T:
+        """Result of compute(), shared with the identical requests running at the same time"""
+        flight, leader = self._join(self._flights, key)
+        if leader:
+            flight.task = asyncio.create_task(compute())
+            self._forget_when_done(self._flights, key, flight)
+            self.stats["computed"] += 1
+        else:
+            self.stats["coalesced"] += 1
+            coalesced_requests.inc(endpoint="/ask")
+            record_coalesced()
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            self._leave(self._flights, key, flight)
+
+    async def _produce(self, flight: _Flight, stream: AsyncIterator[str]) -> None:
+        try:
+            async for part in stream:
+                flight.parts.append(part)
+                flight.notify()
+        except Exception as e:
+            flight.error = e
+        finally:
+            await stream.aclose()
+            flight.done = True
+            flight.notify()
+
+    async def stream(self, key: tuple, compute: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Parts of compute(), shared with the identical requests streaming at the same time"""
+        flight, leader = self._join(self._streams, key)
+        if leader:
+            flight.task = asyncio.create_task(self._produce(flight, compute()))
+            self._forget_when_done(self._streams, key, flight)
+            self.stats["streams_computed"] += 1
+        else:
+            self.stats["streams_coalesced"] += 1
+            coalesced_requests.inc(endpoint="/ask/stream")
+            record_coalesced()
+        flight.waiters += 1
+        try:
+            position = 0
+            while True:
+                while position < len(flight.parts):
+                    position += 1
+                    yield flight.parts[position - 1]
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.updated.wait()
+        finally:
+            self._leave(self._streams, key, flight)
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "in_flight": len(self._flights), "streams_in_flight": len(self._streams)}
@@ -0,0 +1,134 @@
+import re
+from typing import Any, Callable
+
+# how far back to look for text repeated at the start of the next chunk, when char offsets are missing
+MAX_OVERLAP_CHARS = 400
+
+
+def _overlap_length(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is a prefix of right"""
+    for length in range(min(len(left), len(right), MAX_OVERLAP_CHARS), 0, -1):
+        if left.endswith(right[:length]):
+            return length
+    return 0
+
+
+def _join(left: dict[str, Any], right: dict[str, Any]) -> str:
+    """Text of two neighbouring chunks of a file without the overlapping part repeated"""
+    if left.get("char_end") is not None and right.get("char_start") is not None:
+        overlap = left["char_end"] - right["char_start"]
+        if overlap > 0:
+            return left["text"] + right["text"][overlap:]
+        return left["text"] + "\n" + right["text"]
+    overlap = _overlap_length(left["text"], right["text"])
+    if overlap:
+        return left["text"] + right["text"][overlap:]
+    return left["text"] + "\n" + right["text"]
+
+
+def _is_neighbour(left: dict[str, Any], right: dict[str, Any]) -> bool:
+    if right["chunk_index"] == left["chunk_index"] + 1:
+        return True
+    if left.get("char_end") is not None and right.get("char_start") is not None:
+        return right["char_start"] <= left["char_end"]
+    return False
+
+
+def _score(result: dict[str, Any]) -> float:
+    return result.get("rerank_score", result.get("score")) or 0.0
+
+
+def merge_results(results: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Turn search results into context blocks: duplicated chunks are dropped and neighbouring
+    chunks of the same file (consecutive chunk_index or overlapping offsets) are merged into one
+    block. Blocks keep the best score of their chunks and are ordered by it.
+    """
+    seen_texts = set()
+    by_file: dict[str, list[dict[str, Any]]] = {}
+    for result in results:
+        normalized = re.sub(r"\s+", " ", result["text"]).strip()
+        if normalized in seen_texts:
+            continue
+        seen_texts.add(normalized)
+        by_file.setdefault(result.get("file_name", "unknown"), []).append(result)
+
+    blocks = []
+    for file_name, chunks in by_file.items():
+        chunks.sort(key=lambda chunk: (chunk.get("char_start") or 0, chunk["chunk_index"]))
+        block = None
+        for chunk in chunks:
+            if block is not None and chunk.get("char_end") is not None and block.get("char_end") is not None \
+                    and chunk["char_end"] <= block["char_end"]:
+                # fully covered by the block already
+                block["score"] = max(block["score"], _score(chunk))
+                continue
+            if block is not None and _is_neighbour(block, chunk):
+                block = {
+                    **block,
+                    "text": _join(block, chunk),
+                    "chunk_index": chunk["chunk_index"],
+                    "char_end": chunk.get("char_end"),
+                    "page_end": chunk.get("page_end") or block.get("page_end"),
+                    "score": max(block["score"], _score(chunk)),
+                }
+                continue
+            if block is not None:
+                blocks.append(block)
+            block = {
+                "file_name": file_name,
+                "text": chunk["text"],
+                "chunk_index": chunk["chunk_index"],
+                "char_start": chunk.get("char_start"),
+                "char_end": chunk.get("char_end"),
+                "page_start": chunk.get("page_start"),
+                "page_end": chunk.get("page_end"),
+                "score": _score(chunk),
+            }
+        if block is not None:
+            blocks.append(block)
+    blocks.sort(key=lambda block: block["score"], reverse=True)
+    return blocks
+
+
+def citation(number: int, block: dict[str, Any]) -> str:
+    pages = ""
+    if block.get("page_start"):
+        page_end = block.get("page_end") or block["page_start"]
+        pages = f", p. {block['page_start']}" if page_end == block["page_start"] else f", p. {block['page_start']}-{page_end}"
+    return f"[{number}] {block['file_name']}{pages}"
+
+
+def _truncate(text: str, max_tokens: int, count_tokens: Callable[[str], int]) -> str:
+    """Cut text to about max_tokens, at a whitespace"""
+    tokens = count_tokens(text)
+    while tokens > max_tokens and text:
+        text = text[:int(len(text) * max_tokens / tokens * 0.95)].rsplit(" ", 1)[0]
+        tokens = count_tokens(text)
+    return text
+
+
+def assemble_context(
+    results: list[dict[str, Any]],
+    token_budget: int,
+    count_tokens: Callable[[str], int]
+) -> str:
+    """
+    Compact context for the prompt: merged blocks, best first, each under a short citation
+    header, as many as fit token_budget (counted with the model's tokenizer). Blocks that
+    don't fit are skipped, the first one is truncated if it's bigger than the whole budget.
+    """
+    parts = []
+    used = 0
+    for block in merge_results(results):
+        header = citation(len(parts) + 1, block)
+        part = f"{header}\n{block['text']}"
+        tokens = count_tokens(part)
+        if used + tokens > token_budget:
+            if parts:
+                continue
+            part = _truncate(part, token_budget, count_tokens)
+            tokens = count_tokens(part)
+        parts.append(part)
+        used += tokens
+    return "\n\n".join(parts)
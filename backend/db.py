@@ -1,6 +1,10 @@
 import os
-import psycopg2
+import queue
+import threading
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from datetime import datetime
+from time import monotonic, sleep
 from uuid import uuid4
 from zoneinfo import ZoneInfo
 
@@ -8,39 +12,302 @@ from zoneinfo import ZoneInfo
 TZ_INFO = os.getenv("TZ", "Europe/Warsaw")
 tz = ZoneInfo(TZ_INFO)
 
-def get_db_connection():
-    return psycopg2.connect(
-        host=os.getenv("POSTGRES_HOST", "postgres"),
-        database=os.getenv("POSTGRES_DB", "pdf_research_assistant"),
-        user=os.getenv("POSTGRES_USER", "postgres"),
-        password=os.getenv("POSTGRES_PASSWORD", "postgres"),
+DB_POOL_MIN_CONNECTIONS = int(os.getenv("DB_POOL_MIN_CONNECTIONS", 1))
+DB_POOL_MAX_CONNECTIONS = int(os.getenv("DB_POOL_MAX_CONNECTIONS", 4))
+DB_LOG_QUEUE_SIZE = int(os.getenv("DB_LOG_QUEUE_SIZE", 10000))
+DB_LOG_BATCH_SIZE = int(os.getenv("DB_LOG_BATCH_SIZE", 100))
+DB_LOG_FLUSH_INTERVAL = float(os.getenv("DB_LOG_FLUSH_INTERVAL", 2))
+DB_LOG_ENQUEUE_TIMEOUT = float(os.getenv("DB_LOG_ENQUEUE_TIMEOUT", 0.1))
+DB_LOG_MAX_RETRIES = int(os.getenv("DB_LOG_MAX_RETRIES", 3))
+
+_pool: ThreadedConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+# schema changes made after the first release: init.sql only runs on a fresh postgres volume,
+# so existing databases get them when the backend starts
+MIGRATIONS = [
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS first_token_time FLOAT",
+    """
+    CREATE TABLE IF NOT EXISTS stage_timings (
+        conversation_id TEXT NOT NULL REFERENCES conversations(id),
+        model_used TEXT NOT NULL,
+        stage TEXT NOT NULL,
+        duration FLOAT NOT NULL,
+        timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+        PRIMARY KEY (conversation_id, stage)
     )
+    """,
+    "CREATE INDEX IF NOT EXISTS stage_timings_timestamp_idx ON stage_timings (timestamp)",
+    """
+    CREATE TABLE IF NOT EXISTS llm_stats (
+        conversation_id TEXT PRIMARY KEY REFERENCES conversations(id),
+        model_used TEXT NOT NULL,
+        load_duration FLOAT,
+        prompt_eval_duration FLOAT,
+        eval_duration FLOAT,
+        prompt_eval_count INTEGER,
+        eval_count INTEGER,
+        tokens_per_second FLOAT,
+        timestamp TIMESTAMP WITH TIME ZONE NOT NULL
+    )
+    """,
+]
 
-def save_conversation(question, answer_data, timestamp=None):
-    if timestamp is None:
-        timestamp = datetime.now(tz)
 
-    conn = get_db_connection()
+def get_db_pool() -> ThreadedConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(
+                    DB_POOL_MIN_CONNECTIONS,
+                    DB_POOL_MAX_CONNECTIONS,
+                    host=os.getenv("POSTGRES_HOST", "postgres"),
+                    database=os.getenv("POSTGRES_DB", "pdf_research_assistant"),
+                    user=os.getenv("POSTGRES_USER", "postgres"),
+                    password=os.getenv("POSTGRES_PASSWORD", "postgres"),
+                )
+    return _pool
+
+
+def migrate_db() -> None:
+    """Apply MIGRATIONS, every statement is idempotent"""
+    try:
+        pool = get_db_pool()
+        conn = pool.getconn()
+    except Exception as e:
+        print(f"Error connecting to the database to migrate it: {e}")
+        return
+    try:
+        with conn.cursor() as cur:
+            for statement in MIGRATIONS:
+                cur.execute(statement)
+        conn.commit()
+        print("Database schema is up to date")
+    except Exception as e:
+        conn.rollback()
+        print(f"Error migrating the database: {e}")
+    finally:
+        pool.putconn(conn)
+
+
+def _conversation_row(conversation_id, question, answer_data, timestamp) -> tuple:
+    return (
+        conversation_id,
+        question,
+        answer_data["answer"],
+        answer_data["model_used"],
+        answer_data["response_time"],
+        answer_data.get("first_token_time"),
+        answer_data["relevance"],
+        answer_data["relevance_explanation"],
+        timestamp
+    )
+
+
+def _stage_rows(conversation_id, answer_data, timestamp) -> list[tuple]:
+    timings = answer_data.get("timings") or {}
+    return [
+        (conversation_id, answer_data["model_used"], stage, duration, timestamp)
+        for stage, duration in timings.get("stages", {}).items()
+    ]
+
+
+def _llm_stats_row(conversation_id, answer_data, timestamp) -> tuple | None:
+    timings = answer_data.get("timings") or {}
+    if timings.get("eval_count") is None:
+        return None
+    return (
+        conversation_id,
+        answer_data["model_used"],
+        timings.get("load_duration"),
+        timings.get("prompt_eval_duration"),
+        timings.get("eval_duration"),
+        timings.get("prompt_eval_count"),
+        timings.get("eval_count"),
+        timings.get("tokens_per_second"),
+        timestamp
+    )
+
+
+def save_conversations(records: list[dict]) -> None:
+    """
+    Insert many conversations, with their stage timings and Ollama stats, using one
+    multi-row INSERT per table on a pooled connection
+    """
+    conversation_rows = [record["conversation"] for record in records]
+    stage_rows = [row for record in records for row in record["stages"]]
+    llm_stats_rows = [record["llm_stats"] for record in records if record["llm_stats"]]
+    pool = get_db_pool()
+    conn = pool.getconn()
     try:
         with conn.cursor() as cur:
-            cur.execute(
+            execute_values(
+                cur,
                 """
-                INSERT INTO conversations 
-                (id, question, answer, model_used, response_time, relevance, 
+                INSERT INTO conversations
+                (id, question, answer, model_used, response_time, first_token_time, relevance,
                 relevance_explanation, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                VALUES %s
                 """,
-                (
-                    str(uuid4()),
-                    question,
-                    answer_data["answer"],
-                    answer_data["model_used"],
-                    answer_data["response_time"],
-                    answer_data["relevance"],
-                    answer_data["relevance_explanation"],
-                    timestamp
-                ),
+                conversation_rows,
             )
+            if stage_rows:
+                execute_values(
+                    cur,
+                    """
+                    INSERT INTO stage_timings
+                    (conversation_id, model_used, stage, duration, timestamp)
+                    VALUES %s
+                    """,
+                    stage_rows,
+                )
+            if llm_stats_rows:
+                execute_values(
+                    cur,
+                    """
+                    INSERT INTO llm_stats
+                    (conversation_id, model_used, load_duration, prompt_eval_duration, eval_duration,
+                    prompt_eval_count, eval_count, tokens_per_second, timestamp)
+                    VALUES %s
+                    """,
+                    llm_stats_rows,
+                )
         conn.commit()
+    except Exception:
+        # a connection lost to a Postgres restart is closed already, the pool then drops it
+        if not conn.closed:
+            conn.rollback()
+        raise
     finally:
-        conn.close()
+        pool.putconn(conn)
+
+
+class ConversationLogger:
+    """
+    Write-behind logger of conversations.
+
+    save() only puts the row on a bounded in-memory queue; a background thread flushes
+    the queue in batches when `batch_size` rows are waiting or every `flush_interval` seconds.
+    When the queue is full, save() waits up to `enqueue_timeout` and then drops the row.
+    A failed batch is retried `max_retries` times with backoff, then written row by row, so
+    only the rows that still fail are dropped. stop() drains the queue before returning.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = DB_LOG_QUEUE_SIZE,
+        batch_size: int = DB_LOG_BATCH_SIZE,
+        flush_interval: float = DB_LOG_FLUSH_INTERVAL,
+        enqueue_timeout: float = DB_LOG_ENQUEUE_TIMEOUT,
+        max_retries: int = DB_LOG_MAX_RETRIES
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max(1, max_retries)
+        self._queue: queue.Queue[dict] = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.stats = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[name] += value
+
+    def save(self, record: dict) -> bool:
+        try:
+            self._queue.put(record, timeout=self.enqueue_timeout)
+        except queue.Full:
+            print("Conversation log queue is full, dropping conversation")
+            self._count("dropped")
+            return False
+        self._count("enqueued")
+        return True
+
+    def _next_batch(self) -> list[dict]:
+        batch = []
+        deadline = monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - monotonic()
+            if timeout <= 0 or (self._stop.is_set() and self._queue.empty()):
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: list[dict]) -> None:
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                save_conversations(batch)
+                self._count("written", len(batch))
+                self._count("batches")
+                return
+            except Exception as e:
+                print(f"Error saving {len(batch)} conversations to the database (attempt {attempt}/{self.max_retries}): {e}")
+                if attempt < self.max_retries:
+                    sleep(2 ** (attempt - 1))
+        # one bad row fails the whole batch, write the rows one by one so only it is lost
+        for record in batch:
+            try:
+                save_conversations([record])
+                self._count("written")
+            except Exception as e:
+                print(f"Error saving conversation to the database, dropping it: {e}")
+                self._count("failed")
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        self._worker.join(timeout)
+        if self._worker.is_alive():
+            print(f"Conversation log not flushed in {timeout}s, {self._queue.qsize()} queued conversations are lost")
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            return {**self.stats, "queue_depth": self._queue.qsize()}
+
+
+_conversation_logger: ConversationLogger | None = None
+_logger_lock = threading.Lock()
+
+
+def get_conversation_logger() -> ConversationLogger:
+    global _conversation_logger
+    if _conversation_logger is None:
+        with _logger_lock:
+            if _conversation_logger is None:
+                _conversation_logger = ConversationLogger()
+    return _conversation_logger
+
+
+def save_conversation(question, answer_data, timestamp=None):
+    """Queue the conversation (and its timings, if answer_data has them) to be written in the next batch"""
+    if timestamp is None:
+        timestamp = datetime.now(tz)
+    conversation_id = str(uuid4())
+    get_conversation_logger().save({
+        "conversation": _conversation_row(conversation_id, question, answer_data, timestamp),
+        "stages": _stage_rows(conversation_id, answer_data, timestamp),
+        "llm_stats": _llm_stats_row(conversation_id, answer_data, timestamp),
+    })
+
+
+def shutdown_db(timeout: float | None = 30) -> None:
+    """Flush queued conversations (waiting at most `timeout` seconds) and close pooled connections"""
+    global _pool
+    if _conversation_logger is not None:
+        _conversation_logger.stop(timeout)
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
@@ -0,0 +1,239 @@
+import json
+import os
+import random
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from time import monotonic
+from uuid import uuid4
+from .rag import evaluate_relevance_batch, clean_qwen_response
+from .db import save_conversation, tz
+
+EVAL_QUEUE_SIZE = int(os.getenv("EVAL_QUEUE_SIZE", 200))
+EVAL_SAMPLE_RATE = float(os.getenv("EVAL_SAMPLE_RATE", 1.0))
+EVAL_BATCH_SIZE = int(os.getenv("EVAL_BATCH_SIZE", 4))
+EVAL_MODEL = os.getenv("EVAL_MODEL")  # e.g. "qwen3:1.7b", by default the model that answered
+EVAL_MAX_DEFER = float(os.getenv("EVAL_MAX_DEFER", 60))
+EVAL_QUEUE_PATH = os.getenv("EVAL_QUEUE_PATH", str(Path(__file__).parent.parent / "data" / ".pending_evaluations.json"))
+
+
+class EvaluationScheduler:
+    """
+    Runs LLM-as-judge relevance evaluations of answers in a background thread, with lower
+    priority than user requests.
+
+    - only `sample_rate` of answers are evaluated, the rest are saved as NOT_EVALUATED
+    - answers submitted with evaluate=False (served from the answer cache, or shared by coalesced
+      requests and evaluated once) are saved as NOT_EVALUATED
+    - the queue is bounded, answers that don't fit are saved as SKIPPED
+    - evaluations wait while user requests are in flight (at most `max_defer` seconds)
+    - up to `batch_size` answers for the same model are evaluated with one prompt
+    - pending jobs are persisted to `queue_path`, so a restart doesn't lose them
+
+    submit() is called on the event loop, so it only queues in memory: persisting the queue and
+    saving unevaluated answers happen on a second background thread.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = EVAL_QUEUE_SIZE,
+        sample_rate: float = EVAL_SAMPLE_RATE,
+        batch_size: int = EVAL_BATCH_SIZE,
+        eval_model: str | None = EVAL_MODEL,
+        max_defer: float = EVAL_MAX_DEFER,
+        queue_path: str | None = EVAL_QUEUE_PATH
+    ):
+        self.queue_size = queue_size
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.eval_model = eval_model
+        self.max_defer = max_defer
+        self.queue_path = Path(queue_path) if queue_path else None
+        self._jobs: deque[dict] = deque()
+        self._in_progress: list[dict] = []
+        # answers saved without evaluation, with their status, waiting for the I/O thread
+        self._unevaluated: list[tuple[dict, str]] = []
+        # the queue changed since it was last persisted
+        self._dirty = False
+        self._condition = threading.Condition()
+        self._user_requests = 0
+        self._stop = False
+        self._io_stop = False
+        self.stats = {"submitted": 0, "evaluated": 0, "not_evaluated": 0, "not_sampled": 0, "skipped": 0, "failed": 0, "batches": 0}
+        self._load()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+        self._io_worker = threading.Thread(target=self._run_io, daemon=True)
+        self._io_worker.start()
+
+    @contextmanager
+    def user_request(self):
+        """Wrap user facing work, evaluations are held back while it runs"""
+        with self._condition:
+            self._user_requests += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._user_requests -= 1
+                self._condition.notify_all()
+
+    def submit(
+        self,
+        query: str,
+        response: str,
+        model: str,
+        response_time: float,
+        first_token_time: float | None = None,
+        timings: dict | None = None,
+        evaluate: bool = True
+    ) -> None:
+        """Queue the answer for evaluation, evaluate=False only saves it (e.g. an answer from the cache)"""
+        job = {
+            "id": str(uuid4()),
+            "query": query,
+            "answer": clean_qwen_response(response).strip(),
+            "model": model,
+            "response_time": response_time,
+            "first_token_time": first_token_time,
+            "timings": timings,
+            "timestamp": datetime.now(tz).isoformat(),
+        }
+        with self._condition:
+            self.stats["submitted"] += 1
+            if not evaluate:
+                self.stats["not_evaluated"] += 1
+                self._unevaluated.append((job, "NOT_EVALUATED"))
+            elif random.random() >= self.sample_rate:
+                self.stats["not_sampled"] += 1
+                self._unevaluated.append((job, "NOT_EVALUATED"))
+            elif len(self._jobs) >= self.queue_size:
+                print("Evaluation queue is full, saving answer without evaluation")
+                self.stats["skipped"] += 1
+                self._unevaluated.append((job, "SKIPPED"))
+            else:
+                self._jobs.append(job)
+                self._dirty = True
+            self._condition.notify_all()
+
+    @staticmethod
+    def _save(job: dict, relevance_result: dict) -> None:
+        answer_data = {
+            "answer": job["answer"],
+            "model_used": job["model"],
+            "response_time": job["response_time"],
+            "first_token_time": job["first_token_time"],
+            "timings": job.get("timings"),
+            "relevance": relevance_result.get("Relevance", "UNKNOWN"),
+            "relevance_explanation": relevance_result.get("Explanation", "No explanation provided"),
+        }
+        save_conversation(job["query"], answer_data, datetime.fromisoformat(job["timestamp"]))
+
+    def _next_batch(self) -> list[dict] | None:
+        with self._condition:
+            while not self._jobs and not self._stop:
+                self._condition.wait()
+            if self._stop:
+                return None
+            # give way to user requests, but don't starve the queue
+            deferred_since = monotonic()
+            while self._user_requests and not self._stop:
+                remaining = self.max_defer - (monotonic() - deferred_since)
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            model = self._jobs[0]["model"]
+            batch = [job for job in self._jobs if job["model"] == model][:self.batch_size]
+            for job in batch:
+                self._jobs.remove(job)
+            self._in_progress = batch
+            return batch
+
+    def _run(self):
+        while (batch := self._next_batch()) is not None:
+            model = self.eval_model or batch[0]["model"]
+            try:
+                print(f"Evaluating relevance of {len(batch)} answers in background")
+                results = evaluate_relevance_batch([(job["query"], job["answer"]) for job in batch], model)
+                self.stats["evaluated"] += len(batch)
+            except Exception as e:
+                print(f"Error evaluating answers: {e}")
+                results = [{"Relevance": "UNKNOWN", "Explanation": f"Evaluation failed: {e}"} for _ in batch]
+                self.stats["failed"] += len(batch)
+            self.stats["batches"] += 1
+            for job, result in zip(batch, results):
+                try:
+                    self._save(job, result)
+                except Exception as e:
+                    print(f"Error saving conversation: {e}")
+            with self._condition:
+                self._in_progress = []
+                self._dirty = True
+                self._condition.notify_all()
+
+    def _run_io(self):
+        """Persist the queue when it changed and save answers that are not evaluated"""
+        while True:
+            with self._condition:
+                while not self._dirty and not self._unevaluated and not self._io_stop:
+                    self._condition.wait()
+                if not self._dirty and not self._unevaluated:
+                    return
+                unevaluated, self._unevaluated = self._unevaluated, []
+                pending = self._in_progress + list(self._jobs) if self._dirty else None
+                self._dirty = False
+            if pending is not None:
+                self._persist(pending)
+            for job, status in unevaluated:
+                try:
+                    self._save(job, {"Relevance": status, "Explanation": "Answer was not evaluated"})
+                except Exception as e:
+                    print(f"Error saving conversation: {e}")
+
+    def _persist(self, jobs: list[dict]) -> None:
+        """Write pending jobs to disk, only called from the I/O thread"""
+        if not self.queue_path:
+            return
+        try:
+            tmp_path = self.queue_path.with_suffix(".tmp")
+            with tmp_path.open("w") as f:
+                json.dump(jobs, f)
+            os.replace(tmp_path, self.queue_path)
+        except OSError as e:
+            print(f"Error persisting evaluation queue: {e}")
+
+    def _load(self) -> None:
+        if not self.queue_path or not self.queue_path.exists():
+            return
+        try:
+            with self.queue_path.open() as f:
+                jobs = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error loading evaluation queue: {e}")
+            return
+        self._jobs.extend(jobs[:self.queue_size])
+        print(f"Restored {len(self._jobs)} pending evaluations")
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stop the worker after the current batch, pending jobs stay persisted for the next start"""
+        with self._condition:
+            self._stop = True
+            self._dirty = True
+            self._condition.notify_all()
+        self._worker.join(timeout)
+        # the worker persists its last batch, the I/O thread writes it out and exits
+        with self._condition:
+            self._io_stop = True
+            self._condition.notify_all()
+        self._io_worker.join(timeout)
+
+    def get_stats(self) -> dict:
+        with self._condition:
+            return {
+                **self.stats,
+                "queue_depth": len(self._jobs),
+                "in_progress": len(self._in_progress),
+                "user_requests_in_flight": self._user_requests,
+            }
@@ -0,0 +1,135 @@
+"""
+Fake Ollama server for load testing without a GPU / real models.
+
+Implements the parts of the Ollama API the backend uses (/api/generate streaming and not,
+/api/tags, /api/ps) and simulates latency: `ttft` seconds until the first token,
+then tokens at `tokens_per_second`. Relevance evaluation prompts get a parsable JSON answer.
+
+Usage:
+    FAKE_OLLAMA_TTFT=0.5 FAKE_OLLAMA_TPS=20 uvicorn backend.fake_ollama:app --port 11434
+"""
+import asyncio
+import json
+import os
+import random
+import re
+from datetime import datetime, timezone
+from time import perf_counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TTFT = float(os.getenv("FAKE_OLLAMA_TTFT", 0.5))
+TOKENS_PER_SECOND = float(os.getenv("FAKE_OLLAMA_TPS", 20))
+ANSWER_TOKENS = int(os.getenv("FAKE_OLLAMA_ANSWER_TOKENS", 100))
+LOAD_DURATION = float(os.getenv("FAKE_OLLAMA_LOAD_DURATION", 0))
+# how many generations run at once, others wait like on a real single GPU/CPU Ollama
+PARALLEL = int(os.getenv("FAKE_OLLAMA_PARALLEL", 1))
+ERROR_RATE = float(os.getenv("FAKE_OLLAMA_ERROR_RATE", 0))
+
+app = FastAPI()
+_slots: asyncio.Semaphore | None = None
+_loaded_models: set[str] = set()
+stats = {"requests": 0, "in_flight": 0, "errors": 0}
+
+
+def slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(PARALLEL)
+    return _slots
+
+
+def fake_answer(prompt: str) -> list[str]:
+    if '"Relevance": "NON_RELEVANT"' in prompt:
+        pairs = len(re.findall(r"^\s*Pair \d+:", prompt, flags=re.MULTILINE))
+        evaluation = {"Relevance": "RELEVANT", "Explanation": "Fake evaluation"}
+        if pairs:
+            text = json.dumps([{"Id": i, **evaluation} for i in range(1, pairs + 1)])
+        else:
+            text = json.dumps(evaluation)
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+    return [f"token{i} " for i in range(ANSWER_TOKENS)]
+
+
+def now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+async def generate_parts(model: str, prompt: str):
+    """Yield Ollama-like response parts with simulated timing"""
+    start = perf_counter()
+    async with slots():
+        load_duration = 0.0
+        if model not in _loaded_models:
+            await asyncio.sleep(LOAD_DURATION)
+            load_duration = LOAD_DURATION
+            _loaded_models.add(model)
+        prompt_eval_duration = TTFT if prompt else 0.0
+        await asyncio.sleep(prompt_eval_duration)
+        tokens = fake_answer(prompt) if prompt else []
+        eval_start = perf_counter()
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(1 / TOKENS_PER_SECOND)
+            yield {"model": model, "created_at": now(), "response": token, "done": False}
+        eval_duration = perf_counter() - eval_start
+    yield {
+        "model": model,
+        "created_at": now(),
+        "response": "",
+        "done": True,
+        "done_reason": "stop",
+        "total_duration": int((perf_counter() - start) * 1e9),
+        "load_duration": int(load_duration * 1e9),
+        "prompt_eval_count": len(prompt.split()),
+        "prompt_eval_duration": int(prompt_eval_duration * 1e9),
+        "eval_count": len(tokens),
+        "eval_duration": int(eval_duration * 1e9),
+    }
+
+
+@app.post("/api/generate")
+async def generate(request: Request):
+    body = await request.json()
+    model = body.get("model", "fake")
+    # an empty prompt only loads the model, like in Ollama
+    prompt = body.get("system", "") + body["prompt"] if body.get("prompt") else ""
+    stats["requests"] += 1
+    if random.random() < ERROR_RATE:
+        stats["errors"] += 1
+        return JSONResponse({"error": "simulated failure"}, status_code=500)
+
+    if body.get("stream", True):
+        async def stream():
+            stats["in_flight"] += 1
+            try:
+                async for part in generate_parts(model, prompt):
+                    yield json.dumps(part) + "\n"
+            finally:
+                stats["in_flight"] -= 1
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    stats["in_flight"] += 1
+    try:
+        parts = [part async for part in generate_parts(model, prompt)]
+    finally:
+        stats["in_flight"] -= 1
+    final = parts[-1]
+    final["response"] = "".join(part["response"] for part in parts)
+    return final
+
+
+@app.get("/api/tags")
+def tags():
+    return {"models": [{"name": model, "model": model} for model in sorted(_loaded_models)]}
+
+
+@app.get("/api/ps")
+def ps():
+    return {"models": [{"name": model, "model": model} for model in sorted(_loaded_models)]}
+
+
+@app.get("/stats")
+def get_stats():
+    return stats
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+
+class IngestManifest:
+    """
+    Keeps track of what was already ingested to Qdrant, so container restarts
+    only re-embed new or changed PDFs.
+
+    The manifest is a json file:
+        {
+            "settings": {"embedding_model": ..., "chunk_size": ..., "overlap": ..., "collection_name": ...},
+            "files": {"<file_name>": {"sha256": ..., "chunks": ..., "tags_hash": ...}}
+        }
+
+    Tags are tracked per file, so changing them updates the payloads of that file only.
+    """
+
+    def __init__(self, path: Path, settings: dict[str, Any]):
+        self.path = Path(path)
+        self.settings = settings
+        self.files: dict[str, dict[str, Any]] = {}
+        self.settings_changed = False
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            self.settings_changed = True
+            return
+        try:
+            with self.path.open() as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error reading manifest {self.path}, starting from scratch: {e}")
+            self.settings_changed = True
+            return
+        settings = data.get("settings") or {}
+        # older manifests kept the tags of all files in the settings
+        legacy_tags = settings.pop("tags", None)
+        if settings != self.settings:
+            print("Ingestion settings changed since last run, all files will be re-ingested")
+            self.settings_changed = True
+            return
+        self.files = data.get("files", {})
+        if legacy_tags is not None:
+            for file_name, entry in self.files.items():
+                entry.setdefault("tags_hash", self.tags_hash(legacy_tags.get(file_name, [])))
+
+    def save(self):
+        tmp_path = self.path.with_suffix(".tmp")
+        with tmp_path.open("w") as f:
+            json.dump({"settings": self.settings, "files": self.files}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        self.files = {}
+
+    @staticmethod
+    def file_hash(path: Path) -> str:
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(block)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def tags_hash(tags: list[str]) -> str:
+        return hashlib.sha256(json.dumps(sorted(tags)).encode()).hexdigest()
+
+    def is_up_to_date(self, file_name: str, sha256: str) -> bool:
+        entry = self.files.get(file_name)
+        return entry is not None and entry["sha256"] == sha256
+
+    def has_filter_fields(self, file_name: str) -> bool:
+        """Files ingested before tags and ingested_at were stored in the payloads have no tags_hash"""
+        return "tags_hash" in self.files.get(file_name, {})
+
+    def tags_changed(self, file_name: str, tags_hash: str) -> bool:
+        return self.files[file_name].get("tags_hash") != tags_hash
+
+    def update(self, file_name: str, sha256: str, chunks: int, tags_hash: str):
+        self.files[file_name] = {"sha256": sha256, "chunks": chunks, "tags_hash": tags_hash}
+
+    def update_tags(self, file_name: str, tags_hash: str):
+        self.files[file_name]["tags_hash"] = tags_hash
+
+    def remove(self, file_name: str):
+        self.files.pop(file_name, None)
+
+    def removed_files(self, current_files: set[str]) -> list[str]:
+        return [file_name for file_name in self.files if file_name not in current_files]
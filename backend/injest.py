@@ -2,16 +2,31 @@ import requests
 from pathlib import Path
 from urllib.parse import unquote
 from pdf_to_qdrant import PDFToQdrant
-from qdrant_connector import QdrantConnector
+from qdrant_connector import QdrantConnector, storage_options_from_env
+from qdrant_connector_hybrid import QdrantConnectorHybrid
+from ingest_manifest import IngestManifest
+from pdf_extraction import PDFExtractor
+import json
 import os
 
 DATA_PATH = Path(__file__).parent.parent / "data"
+MANIFEST_PATH = Path(os.getenv("INGEST_MANIFEST_PATH", DATA_PATH / ".ingest_manifest.json"))
+INGEST_MODE = os.getenv("INGEST_MODE", "incremental")  # "incremental" or "full"
+# collections to fill: "dense", "hybrid" or both ("dense,hybrid") to switch per request
+RETRIEVAL_MODES = os.getenv("INGEST_RETRIEVAL_MODES", os.getenv("RETRIEVAL_MODE", "dense")).split(",")
+CHUNK_SIZE = 800
+OVERLAP = 100
+# optional tags per file, {"file.pdf": ["tag", ...]}, stored in the chunk payloads for filtering
+TAGS_PATH = Path(os.getenv("INGEST_TAGS_PATH", DATA_PATH / "tags.json"))
 
 def download_pdf(url: str, dest_folder: str) -> Path:
     filename = unquote(url.split("/")[-1])
     if not filename.endswith(".pdf"):
         raise ValueError("The URL does not point to a PDF file.")
     filepath = Path(dest_folder) / filename
+    if filepath.exists():
+        print(f"File {filepath} already downloaded, skipping.")
+        return filepath
     print(f"Loading data from: {url}")
     print(f"Saving pdf to: {filepath}")
 
@@ -34,6 +49,87 @@ def list_urls(path: str) -> list[str]:
             return []
         
 
+def load_tags(path: Path = TAGS_PATH) -> dict[str, list[str]]:
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def manifest_path(retrieval_mode: str) -> Path:
+    """Every collection has its own manifest, the dense one keeps the original name"""
+    if retrieval_mode == "dense":
+        return MANIFEST_PATH
+    return MANIFEST_PATH.with_name(f"{MANIFEST_PATH.stem}_{retrieval_mode}{MANIFEST_PATH.suffix}")
+
+def ingest_incremental(
+    qdrant_connector: QdrantConnector, pdf_processor: PDFToQdrant, settings: dict, path: Path = MANIFEST_PATH
+) -> None:
+    manifest = IngestManifest(path, settings)
+    collection_created = qdrant_connector.ensure_collection()
+    if manifest.settings_changed and not collection_created:
+        qdrant_connector.recreate_collection()
+    if manifest.settings_changed or collection_created:
+        manifest.reset()
+
+    pdf_files = {file.name: file for file in DATA_PATH.glob("*.pdf")}
+
+    for file_name in manifest.removed_files(set(pdf_files)):
+        print(f"File {file_name} was removed, deleting its points")
+        qdrant_connector.delete_file_points(file_name)
+        manifest.remove(file_name)
+        manifest.save()
+
+    to_process = {}
+    for file_name, file in pdf_files.items():
+        sha256 = manifest.file_hash(file)
+        tags = pdf_processor.tags.get(file_name, [])
+        tags_hash = manifest.tags_hash(tags)
+        if manifest.is_up_to_date(file_name, sha256):
+            if not manifest.has_filter_fields(file_name):
+                # one-time migration: its points have no tags and ingested_at to filter on
+                print(f"File {file_name} was ingested without filter fields, re-ingesting it")
+            elif manifest.tags_changed(file_name, tags_hash):
+                print(f"Tags of {file_name} changed, updating its points")
+                qdrant_connector.set_file_tags(file_name, tags)
+                manifest.update_tags(file_name, tags_hash)
+                manifest.save()
+                continue
+            else:
+                print(f"File {file_name} unchanged, skipping")
+                continue
+        if file_name in manifest.files:
+            qdrant_connector.delete_file_points(file_name)
+            manifest.remove(file_name)
+            manifest.save()
+        to_process[file] = sha256, tags_hash
+
+    for file, result in pdf_processor.process_pdfs(list(to_process), chunk_size=CHUNK_SIZE, overlap=OVERLAP):
+        if isinstance(result, Exception):
+            print(f"Error ingesting {file.name}, it will be retried on next run: {result}")
+            continue
+        if isinstance(result, int):
+            sha256, tags_hash = to_process[file]
+            manifest.update(file.name, sha256, result, tags_hash)
+            manifest.save()
+
+
+def ingest_full(
+    qdrant_connector: QdrantConnector, pdf_processor: PDFToQdrant, settings: dict, path: Path = MANIFEST_PATH
+) -> None:
+    qdrant_connector.recreate_collection()
+    manifest = IngestManifest(path, settings)
+    manifest.reset()
+    for file, result in pdf_processor.process_pdfs(list(DATA_PATH.glob("*.pdf")), chunk_size=CHUNK_SIZE, overlap=OVERLAP):
+        if isinstance(result, Exception):
+            print(f"Error ingesting {file.name}: {result}")
+            continue
+        if isinstance(result, int):
+            manifest.update(
+                file.name, manifest.file_hash(file), result, manifest.tags_hash(pdf_processor.tags.get(file.name, []))
+            )
+    manifest.save()
+
+
 if __name__ == "__main__":
     urls_path = DATA_PATH / "urls.txt"
     urls = list_urls(urls_path)
@@ -41,13 +137,52 @@ if __name__ == "__main__":
         for url in urls:
             download_pdf(url, DATA_PATH)
 
-    embedding_model = os.getenv("EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
-    qdrant_connector = QdrantConnector(qdrant_host=os.getenv("QDRANT_HOST"), embedding_model=embedding_model
-                                       )
-    qdrant_connector.recreate_collection()
-
-    pdf_processor = PDFToQdrant(qdrant_connector=qdrant_connector)
-    for file in DATA_PATH.glob("*.pdf"):
-        pdf_processor.process_pdf(file, chunk_size=800, overlap=100)
-        
+    extract_workers = os.getenv("EXTRACT_WORKERS")
+    extractor = PDFExtractor(
+        workers=int(extract_workers) if extract_workers else None,
+        pages_per_task=int(os.getenv("EXTRACT_PAGES_PER_TASK", 50)),
+    )
+    tags = load_tags()
+    for retrieval_mode in RETRIEVAL_MODES:
+        if retrieval_mode == "hybrid":
+            storage_options = storage_options_from_env(prefer_grpc=True)
+            qdrant_connector = QdrantConnectorHybrid(
+                qdrant_host=os.getenv("QDRANT_HOST"),
+                embedding_model=os.getenv("HYBRID_EMBEDDING_MODEL", "jinaai/jina-embeddings-v2-small-en"),
+                encode_batch_size=int(os.getenv("ENCODE_BATCH_SIZE", 64)),
+                upsert_batch_size=int(os.getenv("UPSERT_BATCH_SIZE", 256)),
+                upload_workers=int(os.getenv("UPLOAD_WORKERS", 1)),
+                qdrant_location=storage_options.get("qdrant_location"),
+                prefer_grpc=storage_options.get("prefer_grpc", False),
+                grpc_port=storage_options.get("grpc_port", 6334),
+            )
+            settings = {"retrieval_mode": retrieval_mode}
+        else:
+            qdrant_connector = QdrantConnector(
+                qdrant_host=os.getenv("QDRANT_HOST"),
+                embedding_model=os.getenv("EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"),
+                encode_batch_size=int(os.getenv("ENCODE_BATCH_SIZE", 64)),
+                upsert_batch_size=int(os.getenv("UPSERT_BATCH_SIZE", 256)),
+                upload_workers=int(os.getenv("UPLOAD_WORKERS", 1)),
+                **storage_options_from_env(prefer_grpc=True),
+            )
+            settings = {
+                # collection layout, a change recreates the collection
+                "quantization": qdrant_connector.quantization,
+                "on_disk": qdrant_connector.on_disk,
+                "vector_datatype": qdrant_connector.vector_datatype,
+            }
+        pdf_processor = PDFToQdrant(qdrant_connector=qdrant_connector, extractor=extractor, tags=tags)
+        settings = {
+            "embedding_model": qdrant_connector.embedding_model_name,
+            "collection_name": qdrant_connector.collection_name,
+            "chunk_size": CHUNK_SIZE,
+            "overlap": OVERLAP,
+            **settings,
+        }
 
+        print(f"Ingesting PDFs for {retrieval_mode} retrieval")
+        if INGEST_MODE == "full":
+            ingest_full(qdrant_connector, pdf_processor, settings, manifest_path(retrieval_mode))
+        else:
+            ingest_incremental(qdrant_connector, pdf_processor, settings, manifest_path(retrieval_mode))
@@ -0,0 +1,203 @@
+import threading
+from contextlib import contextmanager
+from typing import AsyncIterator
+
+import httpx
+import ollama
+
+# errors after which the request is retried on another node
+RETRYABLE_ERRORS = (ConnectionError, httpx.TransportError, ollama.ResponseError)
+
+
+def model_key(model: str) -> str:
+    """Model name as /api/ps reports it, Ollama tags untagged names as :latest"""
+    return model if ":" in model else f"{model}:latest"
+
+
+class OllamaNode:
+    """One Ollama instance: its clients, in-flight requests, health and the models it has loaded"""
+
+    def __init__(self, host: str, max_connections: int = 32):
+        self.host = host if host.startswith("http") else f"http://{host}"
+        self.client = ollama.Client(host=self.host)
+        self.async_client = ollama.AsyncClient(
+            host=self.host,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        self.healthy = True
+        self.in_flight = 0
+        self.in_flight_by_model: dict[str, int] = {}
+        self.loaded_models: set[str] = set()
+        self.stats = {"requests": 0, "failures": 0}
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "in_flight_by_model": dict(self.in_flight_by_model),
+            "loaded_models": sorted(self.loaded_models),
+        }
+
+
+class OllamaRouter:
+    """
+    Routes generate calls over a pool of Ollama nodes.
+
+    Each call goes to a healthy node that has the model loaded (warm) if there is one, and
+    among those to the one with the fewest requests in flight. A failed call is retried on
+    another node, up to `max_attempts` nodes (streams only until their first part arrived).
+    A background thread checks every `health_check_interval` seconds which nodes respond and
+    which models they have loaded (/api/ps).
+    """
+
+    def __init__(
+        self,
+        hosts: list[str],
+        max_connections: int = 32,
+        max_attempts: int = 2,
+        health_check_interval: float = 10
+    ):
+        if not hosts:
+            raise ValueError("At least one Ollama host is needed")
+        self.nodes = [OllamaNode(host, max_connections) for host in hosts]
+        self.max_attempts = max(1, min(max_attempts, len(self.nodes)))
+        self.health_check_interval = health_check_interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stats = {"retries": 0, "routed_warm": 0, "routed_cold": 0}
+        self._health_checker = threading.Thread(target=self._run_health_checks, daemon=True)
+        self._health_checker.start()
+
+    def _choose(self, model: str, excluded: set[OllamaNode]) -> OllamaNode:
+        model = model_key(model)
+        with self._lock:
+            candidates = [node for node in self.nodes if node not in excluded and node.healthy]
+            if not candidates:
+                # every node looks down, try them anyway rather than failing without a request
+                candidates = [node for node in self.nodes if node not in excluded] or self.nodes
+            node = min(
+                candidates,
+                key=lambda node: (model not in node.loaded_models, node.in_flight, node.stats["requests"])
+            )
+            self.stats["routed_warm" if model in node.loaded_models else "routed_cold"] += 1
+            return node
+
+    @contextmanager
+    def _track(self, node: OllamaNode, model: str):
+        model = model_key(model)
+        with self._lock:
+            node.in_flight += 1
+            node.in_flight_by_model[model] = node.in_flight_by_model.get(model, 0) + 1
+            node.stats["requests"] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                node.in_flight -= 1
+                node.in_flight_by_model[model] -= 1
+                if not node.in_flight_by_model[model]:
+                    del node.in_flight_by_model[model]
+
+    def _succeeded(self, node: OllamaNode, model: str) -> None:
+        with self._lock:
+            node.healthy = True
+            node.loaded_models.add(model_key(model))
+
+    def _failed(self, node: OllamaNode, model: str, error: Exception, last_attempt: bool) -> None:
+        print(f"Error generating with {model} on {node.host}: {error}")
+        with self._lock:
+            node.stats["failures"] += 1
+            # a model error (e.g. not pulled on this node) doesn't make the node unhealthy
+            if not isinstance(error, ollama.ResponseError):
+                node.healthy = False
+            node.loaded_models.discard(model_key(model))
+            if not last_attempt:
+                self.stats["retries"] += 1
+
+    def generate(self, model: str, **kwargs) -> ollama.GenerateResponse:
+        excluded: set[OllamaNode] = set()
+        for attempt in range(1, self.max_attempts + 1):
+            node = self._choose(model, excluded)
+            with self._track(node, model):
+                try:
+                    response = node.client.generate(model=model, **kwargs)
+                except RETRYABLE_ERRORS as e:
+                    self._failed(node, model, e, attempt == self.max_attempts)
+                    if attempt == self.max_attempts:
+                        raise
+                    excluded.add(node)
+                    continue
+            self._succeeded(node, model)
+            return response
+
+    async def generate_async(self, model: str, **kwargs) -> ollama.GenerateResponse:
+        excluded: set[OllamaNode] = set()
+        for attempt in range(1, self.max_attempts + 1):
+            node = self._choose(model, excluded)
+            with self._track(node, model):
+                try:
+                    response = await node.async_client.generate(model=model, **kwargs)
+                except RETRYABLE_ERRORS as e:
+                    self._failed(node, model, e, attempt == self.max_attempts)
+                    if attempt == self.max_attempts:
+                        raise
+                    excluded.add(node)
+                    continue
+            self._succeeded(node, model)
+            return response
+
+    async def generate_stream(self, model: str, **kwargs) -> AsyncIterator[ollama.GenerateResponse]:
+        excluded: set[OllamaNode] = set()
+        for attempt in range(1, self.max_attempts + 1):
+            node = self._choose(model, excluded)
+            started = False
+            with self._track(node, model):
+                try:
+                    async for part in await node.async_client.generate(model=model, stream=True, **kwargs):
+                        started = True
+                        yield part
+                except RETRYABLE_ERRORS as e:
+                    last_attempt = started or attempt == self.max_attempts
+                    self._failed(node, model, e, last_attempt)
+                    # tokens were already sent to the caller, the answer can't be restarted elsewhere
+                    if last_attempt:
+                        raise
+                    excluded.add(node)
+                    continue
+            self._succeeded(node, model)
+            return
+
+    def preload(self, model: str, **kwargs) -> None:
+        """Load the model on every node (an empty prompt only loads it)"""
+        for node in self.nodes:
+            try:
+                response = node.client.generate(model=model, prompt="", **kwargs)
+                self._succeeded(node, model)
+                print(f"Preloaded model {model} on {node.host} in {(response.load_duration or 0) / 1e9:.1f}s")
+            except RETRYABLE_ERRORS as e:
+                print(f"Error preloading model {model} on {node.host}: {e}")
+
+    def check_health(self) -> None:
+        for node in self.nodes:
+            try:
+                loaded = {model_key(model.model) for model in node.client.ps().models}
+                healthy = True
+            except Exception as e:
+                if node.healthy:
+                    print(f"Ollama node {node.host} is not responding: {e}")
+                loaded, healthy = set(), False
+            with self._lock:
+                node.healthy = healthy
+                node.loaded_models = loaded
+
+    def _run_health_checks(self):
+        while not self._stop.wait(self.health_check_interval):
+            self.check_health()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, "nodes": {node.host: node.get_stats() for node in self.nodes}}
@@ -0,0 +1,197 @@
+"""
+Load test of the backend /ask endpoint.
+
+Drives /ask either at a fixed rate (--qps, open loop: requests are sent on schedule no matter
+how many are still in flight) or with a fixed number of concurrent clients (--concurrency,
+closed loop), for --duration seconds. While running it samples the queue depth of the background
+evaluation scheduler (/evaluation/stats) and of the conversation logger (/db/stats).
+Reports throughput, latency percentiles, error rate and queue depths as JSON.
+
+To run without a GPU point the backend at the fake Ollama server:
+    FAKE_OLLAMA_TTFT=0.5 FAKE_OLLAMA_TPS=20 uvicorn backend.fake_ollama:app --port 11434
+    OLLAMA_HOST=localhost uvicorn backend.app:app --port 8000
+
+Usage:
+    python backend/load_test.py --qps 2 --duration 60 --output load_test.json
+    python backend/load_test.py --concurrency 8 --duration 60 --unique-questions
+"""
+import argparse
+import asyncio
+import csv
+import json
+from collections import Counter
+from datetime import datetime
+from itertools import count
+from pathlib import Path
+from time import perf_counter
+
+import httpx
+import numpy as np
+
+QUESTIONS_PATH = Path(__file__).parent.parent / "notebooks" / "sample_questions.csv"
+
+
+def load_questions(path: Path) -> list[str]:
+    with open(path, newline="") as f:
+        return [row["question"] for row in csv.DictReader(f) if row.get("question")]
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    values_ms = np.array(values) * 1000
+    return {
+        "p50_ms": float(np.percentile(values_ms, 50)),
+        "p90_ms": float(np.percentile(values_ms, 90)),
+        "p95_ms": float(np.percentile(values_ms, 95)),
+        "p99_ms": float(np.percentile(values_ms, 99)),
+        "mean_ms": float(values_ms.mean()),
+        "max_ms": float(values_ms.max()),
+    }
+
+
+class LoadTest:
+    def __init__(self, args, questions: list[str]):
+        self.args = args
+        self.questions = questions
+        self.request_ids = count()
+        self.results: list[dict] = []
+        self.queue_samples: list[dict] = []
+        self.in_flight = 0
+
+    def next_question(self) -> str:
+        request_id = next(self.request_ids)
+        question = self.questions[request_id % len(self.questions)]
+        if self.args.unique_questions:
+            # different text for every request, so the answer cache doesn't serve it
+            question = f"{question} (#{request_id})"
+        return question
+
+    async def ask(self, client: httpx.AsyncClient) -> None:
+        self.in_flight += 1
+        start = perf_counter()
+        result = {"start": start}
+        try:
+            response = await client.post(
+                "/ask", json={"model": self.args.model, "text": self.next_question()}, timeout=self.args.timeout
+            )
+            result["status"] = response.status_code
+            if response.status_code == 200:
+                # Ollama's generation time in ns, missing for answers served from the cache
+                total_duration = response.json().get("total_duration")
+                if total_duration:
+                    result["generation_time"] = total_duration / 1e9
+        except httpx.HTTPError as e:
+            result["status"] = type(e).__name__
+        finally:
+            self.in_flight -= 1
+        result["latency"] = perf_counter() - start
+        self.results.append(result)
+
+    async def run_fixed_qps(self, client: httpx.AsyncClient, deadline: float) -> None:
+        interval = 1 / self.args.qps
+        next_send = perf_counter()
+        tasks = set()
+        while next_send < deadline:
+            await asyncio.sleep(max(0.0, next_send - perf_counter()))
+            task = asyncio.create_task(self.ask(client))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            next_send += interval
+        if tasks:
+            await asyncio.wait(tasks)
+
+    async def run_fixed_concurrency(self, client: httpx.AsyncClient, deadline: float) -> None:
+        async def worker():
+            while perf_counter() < deadline:
+                await self.ask(client)
+
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+
+    async def sample_queues(self, client: httpx.AsyncClient, start: float) -> None:
+        while True:
+            sample = {"t": perf_counter() - start, "in_flight": self.in_flight}
+            for name, path in (("evaluation", "/evaluation/stats"), ("conversation_log", "/db/stats")):
+                try:
+                    response = await client.get(path, timeout=5)
+                    sample[name] = response.json()["queue_depth"]
+                except (httpx.HTTPError, ValueError, KeyError):
+                    sample[name] = None
+            self.queue_samples.append(sample)
+            await asyncio.sleep(self.args.stats_interval)
+
+    async def run(self) -> dict:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        async with httpx.AsyncClient(base_url=self.args.url, limits=limits) as client:
+            start = perf_counter()
+            deadline = start + self.args.duration
+            sampler = asyncio.create_task(self.sample_queues(client, start))
+            try:
+                if self.args.qps:
+                    await self.run_fixed_qps(client, deadline)
+                else:
+                    await self.run_fixed_concurrency(client, deadline)
+            finally:
+                sampler.cancel()
+            elapsed = perf_counter() - start
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> dict:
+        ok = [result for result in self.results if result["status"] == 200]
+        errors = Counter(str(result["status"]) for result in self.results if result["status"] != 200)
+
+        def queue_stats(name):
+            depths = [sample[name] for sample in self.queue_samples if sample[name] is not None]
+            if not depths:
+                return {}
+            return {"max": max(depths), "mean": float(np.mean(depths)), "final": depths[-1]}
+
+        return {
+            "created_at": datetime.now().isoformat(),
+            "url": self.args.url,
+            "model": self.args.model,
+            "mode": f"qps={self.args.qps}" if self.args.qps else f"concurrency={self.args.concurrency}",
+            "duration_s": elapsed,
+            "requests": len(self.results),
+            "succeeded": len(ok),
+            "errors": dict(errors),
+            "error_rate": len(self.results) and (len(self.results) - len(ok)) / len(self.results),
+            "throughput_rps": len(ok) / elapsed if elapsed else None,
+            "latency": percentiles([result["latency"] for result in ok]),
+            "generation_time": percentiles([result["generation_time"] for result in ok if "generation_time" in result]),
+            "evaluation_queue_depth": queue_stats("evaluation"),
+            "conversation_log_queue_depth": queue_stats("conversation_log"),
+            "queue_samples": self.queue_samples,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the backend /ask endpoint")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--qps", type=float, help="Send requests at a fixed rate (open loop)")
+    mode.add_argument("--concurrency", type=int, help="Keep N requests in flight (closed loop)")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--model", default="qwen3:1.7b")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to send requests for")
+    parser.add_argument("--timeout", type=float, default=400, help="Per request timeout in seconds")
+    parser.add_argument("--questions", default=str(QUESTIONS_PATH), help="CSV with a question column")
+    parser.add_argument("--unique-questions", action="store_true", help="Make every question unique to bypass the answer cache")
+    parser.add_argument("--stats-interval", type=float, default=1, help="Seconds between queue depth samples")
+    parser.add_argument("--output", default=None, help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    questions = load_questions(Path(args.questions))
+    if not questions:
+        raise SystemExit(f"No questions found in {args.questions}")
+
+    report = asyncio.run(LoadTest(args, questions).run())
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+        print(f"Results written to {args.output}")
+    # the samples are only useful in the file, keep the printed summary short
+    print(json.dumps({key: value for key, value in report.items() if key != "queue_samples"}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Any, Callable
+
+# seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 200)
+# load_duration above this means Ollama (re)loaded the model for the request
+MODEL_LOAD_THRESHOLD = 0.5
+
+
+class Counter:
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(dict(key))} {value}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback when metrics are rendered"""
+
+    def __init__(self, name: str, description: str, callback: Callable[[], float]):
+        self.name = name
+        self.description = description
+        self.callback = callback
+
+    def render(self) -> list[str]:
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in self._series.items():
+                labels = dict(key)
+                cumulative = 0
+                for bucket, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bucket})} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {series[-1]}")
+        return lines
+
+
+def _format_labels(labels: dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    formatted = ",".join(f'{name}="{str(value)}"' for name, value in labels.items())
+    return "{" + formatted + "}"
+
+
+_metrics: list[Counter | Gauge | Histogram] = []
+
+
+def register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+stage_duration = register(Histogram(
+    "rag_stage_duration_seconds", "Duration of RAG pipeline stages"
+))
+llm_tokens = register(Counter(
+    "rag_llm_tokens_total", "Tokens processed by Ollama (kind=prompt|generated)"
+))
+llm_tokens_per_second = register(Histogram(
+    "rag_llm_tokens_per_second", "Generation speed reported by Ollama", TOKENS_PER_SECOND_BUCKETS
+))
+requests_total = register(Counter(
+    "rag_requests_total", "Answered /ask requests"
+))
+llm_model_loads = register(Counter(
+    "rag_llm_model_loads_total", "Requests for which Ollama had to load the model"
+))
+coalesced_requests = register(Counter(
+    "rag_coalesced_requests_total", "Requests answered by an identical request already in flight"
+))
+
+
+class RequestTimings:
+    """Per-request durations of the RAG stages, filled in while the request runs"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.stages: dict[str, float] = {}
+        self.llm: dict[str, float | int | None] = {}
+        # answered from the answer cache, without generating
+        self.cached = False
+        # answered by an identical request already in flight
+        self.coalesced = False
+
+    def record(self, stage: str, duration: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + duration
+        stage_duration.observe(duration, stage=stage, model=self.model)
+
+    def record_llm_response(self, response) -> None:
+        """Take Ollama's own counters from the final GenerateResponse (durations are in nanoseconds)"""
+        def seconds(value):
+            return value / 1e9 if value is not None else None
+
+        self.llm = {
+            "load_duration": seconds(response.load_duration),
+            "prompt_eval_duration": seconds(response.prompt_eval_duration),
+            "eval_duration": seconds(response.eval_duration),
+            "prompt_eval_count": response.prompt_eval_count,
+            "eval_count": response.eval_count,
+        }
+        for name in ("load_duration", "prompt_eval_duration", "eval_duration"):
+            if self.llm[name] is not None:
+                stage_duration.observe(self.llm[name], stage=f"llm_{name.removesuffix('_duration')}", model=self.model)
+        if (self.llm["load_duration"] or 0) > MODEL_LOAD_THRESHOLD:
+            llm_model_loads.inc(model=self.model)
+        if response.prompt_eval_count:
+            llm_tokens.inc(response.prompt_eval_count, kind="prompt", model=self.model)
+        if response.eval_count:
+            llm_tokens.inc(response.eval_count, kind="generated", model=self.model)
+            if self.llm["eval_duration"]:
+                llm_tokens_per_second.observe(self.tokens_per_second, model=self.model)
+
+    @property
+    def tokens_per_second(self) -> float | None:
+        if self.llm.get("eval_count") and self.llm.get("eval_duration"):
+            return self.llm["eval_count"] / self.llm["eval_duration"]
+        return None
+
+    def as_dict(self) -> dict:
+        return {
+            "stages": dict(self.stages),
+            **self.llm,
+            "tokens_per_second": self.tokens_per_second,
+        }
+
+
+current_timings: ContextVar[RequestTimings | None] = ContextVar("current_timings", default=None)
+
+
+@contextmanager
+def track_request(model: str):
+    """Collect stage timings of everything that runs inside, in this task and threads/tasks it starts"""
+    timings = RequestTimings(model)
+    token = current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        current_timings.reset(token)
+
+
+def record_stage(name: str, duration: float) -> None:
+    timings = current_timings.get()
+    if timings is not None:
+        timings.record(name, duration)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage of the current request (no-op outside of track_request)"""
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, perf_counter() - start)
+
+
+def record_cache_hit() -> None:
+    timings = current_timings.get()
+    if timings is not None:
+        timings.cached = True
+
+
+def record_coalesced() -> None:
+    timings = current_timings.get()
+    if timings is not None:
+        timings.coalesced = True
+
+
+def record_llm_response(response) -> None:
+    timings = current_timings.get()
+    if timings is not None:
+        timings.record_llm_response(response)
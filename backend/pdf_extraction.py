@@ -0,0 +1,94 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from pathlib import Path
+from typing import Iterator
+
+from pypdf import PdfReader
+
+# Workers are spawned instead of forked: the parent process already holds torch / the embedding model
+# with its own thread pools, which isn't safe to fork.
+MP_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def count_pages(pdf_path: str) -> int:
+    return len(PdfReader(pdf_path).pages)
+
+
+def extract_pages(pdf_path: str, start: int, end: int) -> list[str]:
+    """Extract text of pages [start, end) - runs inside a worker process"""
+    reader = PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+class PDFExtractor:
+    """
+    Extracts text from PDFs in a pool of processes.
+
+    Every PDF is split into page ranges of `pages_per_task` pages, so big files are parsed
+    on several cores as well. At most `max_pending_tasks` page ranges are submitted ahead of
+    the consumer: parsing of the next pages/files overlaps with embedding and uploading of
+    the current ones, while memory stays bounded to that window of pages.
+    """
+
+    def __init__(self, workers: int | None = None, pages_per_task: int = 50, max_pending_tasks: int | None = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
+        self.max_pending_tasks = max_pending_tasks or 2 * self.workers
+
+    def _plan(self, pdf_paths: list[Path]) -> Iterator[tuple[Path, tuple[int, int] | Exception]]:
+        for pdf_path in pdf_paths:
+            try:
+                page_count = count_pages(str(pdf_path))
+            except Exception as e:
+                yield pdf_path, e
+                continue
+            for start in range(0, page_count, self.pages_per_task):
+                yield pdf_path, (start, min(start + self.pages_per_task, page_count))
+
+    def iter_documents(self, pdf_paths: list[Path]) -> Iterator[tuple[Path, Iterator[str]]]:
+        """
+        Yield (pdf_path, pages) for every file in order of pdf_paths, where pages is a lazy
+        iterator of page texts. Iterating pages raises if the file couldn't be parsed;
+        pages that were not consumed are skipped before the next document is yielded.
+        """
+        plan = self._plan(pdf_paths)
+        pending: deque[tuple[Path, Future | Exception]] = deque()
+
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=MP_CONTEXT) as executor:
+
+            def fill():
+                while len(pending) < self.max_pending_tasks:
+                    task = next(plan, None)
+                    if task is None:
+                        return
+                    pdf_path, page_range = task
+                    if isinstance(page_range, Exception):
+                        pending.append((pdf_path, page_range))
+                    else:
+                        pending.append((pdf_path, executor.submit(extract_pages, str(pdf_path), *page_range)))
+
+            def pages(pdf_path: Path) -> Iterator[str]:
+                while pending and pending[0][0] == pdf_path:
+                    _, task = pending.popleft()
+                    fill()
+                    if isinstance(task, Exception):
+                        raise task
+                    yield from task.result()
+
+            fill()
+            while pending:
+                pdf_path = pending[0][0]
+                document_pages = pages(pdf_path)
+                yield pdf_path, document_pages
+                document_pages.close()
+                while pending and pending[0][0] == pdf_path:
+                    pending.popleft()
+                    fill()
+
+    def extract_document(self, pdf_path: str) -> list[str]:
+        """Extract all pages of a single PDF"""
+        for _, pages in self.iter_documents([Path(pdf_path)]):
+            return list(pages)
+        return []
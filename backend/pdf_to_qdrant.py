@@ -1,51 +1,76 @@
 import os
+import time
+from pathlib import Path
+from typing import Iterable, Iterator
 from qdrant_connector import QdrantConnector
-from langchain_community.document_loaders import PyMuPDFLoader, PDFPlumberLoader, PyPDFLoader
+from pdf_extraction import PDFExtractor
+from chunking import chunk_pages
 
 
 
 class PDFToQdrant:
-    def __init__(self, qdrant_connector: QdrantConnector):
+    def __init__(
+        self,
+        qdrant_connector: QdrantConnector,
+        extractor: PDFExtractor | None = None,
+        tags: dict[str, list[str]] | None = None
+    ):
         """
         Initialize PDF to Qdrant processing system
-        
+
         Args:
-            qdrant_host: Qdrant server host address
-            qdrant_port: Qdrant server port
-            embedding_model: Model for creating embeddings
-            collection_name: Collection name in Qdrant
+            qdrant_connector: Connector used to embed and upload chunks
+            extractor: Process pool based PDF text extractor
+            tags: Tags stored with the chunks of each file, by file name
         """
         self.qdrant_connector = qdrant_connector
-    
-    def _extract_pdf(self, pdf_path: str) -> str:
-        try:
-            text = ""
-            pages = PyPDFLoader(pdf_path).load()
-            for page in pages:
-                text += page.page_content + "\n"
-            return text
-        except Exception as e:
-            print(f"Error reading PDF: {e}")
-            return ""
-    
-    def process_pdf(
-        self, 
-        pdf_path: str, 
-        chunk_size: int = 1000, 
-        overlap: int = 200
-    ) -> None:
-        print(f"Processing file: {pdf_path}")
-        text = self._extract_pdf(pdf_path)
-        if not text.strip():
-            return {"error": "Failed to extract text from PDF"}
-        
-        print(f"Extracted {len(text)} characters of text")
+        self.extractor = extractor or PDFExtractor()
+        self.tags = tags or {}
 
+    def _process_pages(self, pdf_path: str, pages: Iterable[str], chunk_size: int, overlap: int) -> int | dict:
+        file_name = os.path.basename(pdf_path)
         metadata = {
-            "file_name": os.path.basename(pdf_path),
-            "file_path": pdf_path,
+            "file_name": file_name,
+            "file_path": str(pdf_path),
             "chunk_size": chunk_size,
-            "overlap": overlap
+            "overlap": overlap,
+            "ingested_at": int(time.time()),
+            "tags": self.tags.get(file_name, [])
         }
-        
-        self.qdrant_connector.upload_to_qdrant(text, metadata)
\ No newline at end of file
+        chunks = chunk_pages(pages, chunk_size=chunk_size, overlap=overlap)
+        uploaded = self.qdrant_connector.upload_chunks(chunks, metadata)
+        if not uploaded:
+            return {"error": "Failed to extract text from PDF"}
+        return uploaded
+
+    def process_pdf(
+        self,
+        pdf_path: str,
+        chunk_size: int = 1000,
+        overlap: int = 200
+    ) -> int | dict:
+        for _, result in self.process_pdfs([Path(pdf_path)], chunk_size, overlap):
+            if isinstance(result, Exception):
+                print(f"Error processing PDF: {result}")
+                return {"error": str(result)}
+            return result
+        return {"error": "Failed to extract text from PDF"}
+
+    def process_pdfs(
+        self,
+        pdf_paths: list[Path],
+        chunk_size: int = 1000,
+        overlap: int = 200
+    ) -> Iterator[tuple[Path, int | dict | Exception]]:
+        """
+        Stream PDFs page by page through chunking, embedding and upload, while next pages
+        are parsed in worker processes. Yields (pdf_path, result) in order, where result is
+        the number of uploaded chunks, an error dict when no text was extracted,
+        or the exception raised while reading or uploading the file.
+        """
+        for pdf_path, pages in self.extractor.iter_documents(pdf_paths):
+            print(f"Processing file: {pdf_path}")
+            try:
+                yield pdf_path, self._process_pages(pdf_path, pages, chunk_size, overlap)
+            except Exception as e:
+                yield pdf_path, e
@@ -1,125 +1,941 @@
 from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
-from langchain.text_splitter import RecursiveCharacterTextSplitter, CharacterTextSplitter
-from typing import Any
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, FilterSelector, Datatype,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType, BinaryQuantization, BinaryQuantizationConfig,
+    SearchParams, QuantizationSearchParams, SearchRequest, MatchAny, Range, PayloadSchemaType
+)
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass
+from itertools import islice
+import json
+import os
+import queue
+from pathlib import Path
+from typing import Any, Iterable
+import numpy as np
+import re
+import threading
+import time
 import uuid
+import weakref
 
+try:
+    from .chunking import get_sentence_splitter
+except ImportError:
+    # imported by the scripts in backend/ (injest.py, pdf_to_qdrant.py) without the package
+    from chunking import get_sentence_splitter
 
-class QdrantConnector:
-      
-    def __init__(
-        self, 
-        qdrant_host: str = "localhost", 
-        qdrant_port: int = 6333,
-        embedding_model: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
-        collection_name: str = "pdf_documents"
-    ):
-        self.qdrant_client = QdrantClient(host=qdrant_host, port=qdrant_port)
-        self.embedding_model = SentenceTransformer(embedding_model)
-        self.collection_name = collection_name
 
-    def _get_sentence_splitter(self, chunk_size: int, overlap: int) -> RecursiveCharacterTextSplitter:
-        return RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,     # Number of characters per chunk
-            chunk_overlap=overlap,   # Overlap to maintain context
-            separators=["\n\n", "\n", ".", " ", ""]  # Prioritize splitting on paragraph, newline, and sentence boundaries
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache of query embeddings, keyed by model name and normalized query text.
+
+    Embeddings are stored as float32 arrays and the cache is bounded by the total bytes of
+    stored vectors. It can be persisted to a .npz file, so warm restarts skip re-encoding.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, path: str | None = None):
+        self.max_bytes = max_bytes
+        self.path = Path(path) if path else None
+        self._entries: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        if self.path and self.path.exists():
+            self.load()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return re.sub(r"\s+", " ", text).strip()
+
+    def get(self, model: str, text: str) -> np.ndarray | None:
+        key = (model, self.normalize(text))
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return embedding
+
+    def put(self, model: str, text: str, embedding: np.ndarray) -> None:
+        key = (model, self.normalize(text))
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[key] = embedding
+            self._bytes += embedding.nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.stats["evictions"] += 1
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            if not self._entries:
+                return
+            keys = list(self._entries)
+            embeddings = np.stack([self._entries[key] for key in keys])
+        # through a file object, np.savez would append ".npz" to a path without that suffix
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with tmp_path.open("wb") as f:
+            np.savez(
+                f,
+                models=np.array([model for model, _ in keys]),
+                texts=np.array([text for _, text in keys]),
+                embeddings=embeddings
+            )
+        os.replace(tmp_path, self.path)
+        print(f"Saved {len(keys)} query embeddings to {self.path}")
+
+    def load(self) -> None:
+        try:
+            with np.load(self.path) as data:
+                for model, text, embedding in zip(data["models"], data["texts"], data["embeddings"]):
+                    self.put(str(model), str(text), embedding)
+            print(f"Loaded {len(self._entries)} query embeddings from {self.path}")
+        except Exception as e:
+            print(f"Error loading embedding cache from {self.path}: {e}")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+class EmbeddingBatcher:
+    """
+    Collects concurrent single query encode requests into one batch.
+
+    The first request starts a batch window of at most `max_wait` seconds, during which other
+    requests join it until `max_batch_size` is reached. The batch is encoded with one
+    SentenceTransformer.encode call in a background thread and results are handed back
+    through futures to the waiting callers.
+    """
+
+    def __init__(self, embedding_model: SentenceTransformer, max_batch_size: int = 32, max_wait: float = 0.002):
+        self.embedding_model = embedding_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._requests: queue.Queue[tuple[str, Future]] = queue.Queue()
+        self.stats = {"batches": 0, "queries": 0}
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def encode(self, text: str) -> np.ndarray:
+        future: Future = Future()
+        self._requests.put((text, future))
+        return future.result()
+
+    def _collect_batch(self) -> list[tuple[str, Future]]:
+        batch = [self._requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                embeddings = self.embedding_model.encode([text for text, _ in batch], convert_to_numpy=True)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+            self.stats["batches"] += 1
+            self.stats["queries"] += len(batch)
+
+    def get_stats(self) -> dict:
+        batches = self.stats["batches"]
+        return {**self.stats, "avg_batch_size": self.stats["queries"] / batches if batches else 0.0}
+
+
+@dataclass
+class IndexHit:
+    score: float
+    payload: dict[str, Any]
+
+
+# payload fields searches can be filtered on, indexed in Qdrant so filtered HNSW search stays fast
+PAYLOAD_INDEXES = {
+    "file_name": PayloadSchemaType.KEYWORD,
+    "tags": PayloadSchemaType.KEYWORD,
+    "page_start": PayloadSchemaType.INTEGER,
+    "page_end": PayloadSchemaType.INTEGER,
+    "ingested_at": PayloadSchemaType.INTEGER,
+}
+
+
+@dataclass(frozen=True)
+class SearchFilter:
+    """
+    Restricts a search to chunks of given files, overlapping a page range, ingested in a time
+    range (unix seconds) or having any of given tags. Unset fields don't filter.
+    """
+    file_names: tuple[str, ...] | None = None
+    page_from: int | None = None
+    page_to: int | None = None
+    ingested_after: int | None = None
+    ingested_before: int | None = None
+    tags: tuple[str, ...] | None = None
+
+    def is_empty(self) -> bool:
+        return all(value is None for value in (
+            self.file_names, self.page_from, self.page_to, self.ingested_after, self.ingested_before, self.tags
+        ))
+
+    def key(self) -> str:
+        """Stable text form, used in cache keys"""
+        return json.dumps(
+            {name: value for name, value in self.__dict__.items() if value is not None}, sort_keys=True
+        )
+
+    def to_qdrant(self) -> Filter | None:
+        conditions = []
+        if self.file_names is not None:
+            conditions.append(FieldCondition(key="file_name", match=MatchAny(any=list(self.file_names))))
+        if self.tags is not None:
+            conditions.append(FieldCondition(key="tags", match=MatchAny(any=list(self.tags))))
+        # a chunk spans page_start..page_end, it matches when that overlaps the range
+        if self.page_from is not None:
+            conditions.append(FieldCondition(key="page_end", range=Range(gte=self.page_from)))
+        if self.page_to is not None:
+            conditions.append(FieldCondition(key="page_start", range=Range(lte=self.page_to)))
+        if self.ingested_after is not None or self.ingested_before is not None:
+            conditions.append(FieldCondition(
+                key="ingested_at", range=Range(gte=self.ingested_after, lte=self.ingested_before)
+            ))
+        return Filter(must=conditions) if conditions else None
+
+    def matches(self, payload: dict[str, Any]) -> bool:
+        """Same conditions as to_qdrant, for the NumPy index (missing fields don't match)"""
+        def in_range(value, low, high) -> bool:
+            if low is None and high is None:
+                return True
+            return value is not None and (low is None or value >= low) and (high is None or value <= high)
+
+        if self.file_names is not None and payload.get("file_name") not in self.file_names:
+            return False
+        if self.tags is not None and not set(payload.get("tags") or []) & set(self.tags):
+            return False
+        return (
+            in_range(payload.get("page_end"), self.page_from, None)
+            and in_range(payload.get("page_start"), None, self.page_to)
+            and in_range(payload.get("ingested_at"), self.ingested_after, self.ingested_before)
         )
-    
+
+
+class NumpyVectorIndex:
+    """
+    In-process brute-force cosine index for small corpora, persisted to a directory.
+
+    Vectors are kept L2-normalized in one float32 matrix (vectors.npy, memory-mapped on load)
+    and payloads in points.json, so a search is a single matrix-vector product without any
+    network hop. Upserts with an existing id overwrite the point, like in Qdrant. New rows are
+    appended to a list and stacked onto the matrix at the next search, delete or save, so
+    ingesting batch by batch doesn't copy the whole matrix for every batch.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        # rows upserted since the matrix was last stacked, positions continue after the matrix
+        self._new_rows: list[np.ndarray] = []
+        self._ids: list[str] = []
+        self._payloads: list[dict[str, Any]] = []
+        self._positions: dict[str, int] = {}
+        self._lock = threading.Lock()
+        if self.exists():
+            self.load()
+
+    def exists(self) -> bool:
+        return (self.path / "vectors.npy").exists() and (self.path / "points.json").exists()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def payloads(self) -> list[dict[str, Any]]:
+        return self._payloads
+
+    def create(self, dimension: int) -> None:
+        """Start an empty index (dropping existing points) and persist it"""
+        with self._lock:
+            self._vectors = np.zeros((0, dimension), dtype=np.float32)
+            self._new_rows = []
+            self._ids, self._payloads, self._positions = [], [], {}
+        self.save()
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def upsert(self, ids: list[str], vectors: np.ndarray, payloads: list[dict[str, Any]]) -> None:
+        vectors = self._normalize(vectors)
+        with self._lock:
+            for point_id, vector, payload in zip(ids, vectors, payloads):
+                position = self._positions.get(point_id)
+                if position is None:
+                    self._positions[point_id] = len(self._ids)
+                    self._ids.append(point_id)
+                    self._payloads.append(payload)
+                    self._new_rows.append(vector)
+                elif position >= len(self._vectors):
+                    self._new_rows[position - len(self._vectors)] = vector
+                    self._payloads[position] = payload
+                else:
+                    # the loaded matrix is a read-only memmap, copy it before the first write
+                    if not self._vectors.flags.writeable:
+                        self._vectors = np.array(self._vectors)
+                    self._vectors[position] = vector
+                    self._payloads[position] = payload
+
+    def _stacked(self) -> np.ndarray:
+        """The matrix with the appended rows stacked onto it, called with the lock held"""
+        if self._new_rows:
+            dimension = self._new_rows[0].shape[0]
+            self._vectors = np.vstack([self._vectors.reshape(-1, dimension), np.stack(self._new_rows)])
+            self._new_rows = []
+        return self._vectors
+
+    def delete(self, predicate) -> int:
+        """Delete points whose payload matches predicate, returns the number of deleted points"""
+        with self._lock:
+            keep = [i for i, payload in enumerate(self._payloads) if not predicate(payload)]
+            deleted = len(self._ids) - len(keep)
+            if deleted:
+                self._vectors = self._stacked()[keep]
+                self._ids = [self._ids[i] for i in keep]
+                self._payloads = [self._payloads[i] for i in keep]
+                self._positions = {point_id: i for i, point_id in enumerate(self._ids)}
+        return deleted
+
+    def set_payload(self, predicate, payload: dict[str, Any]) -> int:
+        """Merge payload into the payloads matching predicate, returns the number of updated points"""
+        updated = 0
+        with self._lock:
+            for i, point_payload in enumerate(self._payloads):
+                if predicate(point_payload):
+                    self._payloads[i] = {**point_payload, **payload}
+                    updated += 1
+        return updated
+
+    def search(self, query_vector: np.ndarray, limit: int = 5, predicate=None) -> list[IndexHit]:
+        """Top `limit` points by cosine similarity, only among those whose payload matches predicate if given"""
+        with self._lock:
+            vectors, payloads = self._stacked(), self._payloads
+        if predicate is not None:
+            rows = np.array([i for i in range(len(vectors)) if predicate(payloads[i])], dtype=np.int64)
+        else:
+            rows = np.arange(len(vectors))
+        if not len(rows):
+            return []
+        scores = (vectors if predicate is None else vectors[rows]) @ self._normalize(query_vector)
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [IndexHit(score=float(scores[i]), payload=payloads[rows[i]]) for i in top]
+
+    def save(self) -> None:
+        """Write the index atomically, so a reader never sees vectors and payloads out of sync"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            vectors, ids, payloads = np.array(self._stacked()), list(self._ids), list(self._payloads)
+        tmp_vectors, tmp_points = self.path / "vectors.tmp.npy", self.path / "points.json.tmp"
+        np.save(tmp_vectors, vectors)
+        with tmp_points.open("w") as f:
+            json.dump({"ids": ids, "payloads": payloads}, f)
+        os.replace(tmp_vectors, self.path / "vectors.npy")
+        os.replace(tmp_points, self.path / "points.json")
+
+    def load(self) -> None:
+        try:
+            vectors = np.load(self.path / "vectors.npy", mmap_mode="r")
+            with (self.path / "points.json").open() as f:
+                points = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading vector index from {self.path}: {e}")
+            return
+        with self._lock:
+            self._vectors = vectors
+            self._new_rows = []
+            self._ids, self._payloads = points["ids"], points["payloads"]
+            self._positions = {point_id: i for i, point_id in enumerate(self._ids)}
+        print(f"Loaded {len(self._ids)} points from {self.path}")
+
+
+def storage_options_from_env(prefer_grpc: bool = False) -> dict[str, Any]:
+    """
+    QdrantConnector storage options from the environment:
+    VECTOR_STORE = "qdrant" (remote server, default) | "qdrant_local" | "numpy",
+    VECTOR_STORE_PATH = directory of the local Qdrant / NumPy index,
+    QDRANT_QUANTIZATION = "none" | "scalar" | "binary", QDRANT_RESCORE_OVERSAMPLING,
+    QDRANT_ON_DISK = "true" to keep original vectors on disk, QDRANT_VECTOR_DATATYPE = "float32" | "float16",
+    QDRANT_PREFER_GRPC = "true" | "false" to talk to the server over gRPC (QDRANT_GRPC_PORT) or HTTP,
+    prefer_grpc when unset (ingestion uploads vectors as binary gRPC messages instead of JSON by default)
+    """
+    vector_store = os.getenv("VECTOR_STORE", "qdrant")
+    data_path = Path(__file__).parent.parent / "data"
+    if vector_store == "numpy":
+        return {"vector_index_path": os.getenv("VECTOR_STORE_PATH", str(data_path / "vector_index"))}
+    quantization = os.getenv("QDRANT_QUANTIZATION", "none")
+    options = {
+        "quantization": None if quantization == "none" else quantization,
+        "rescore_oversampling": float(os.getenv("QDRANT_RESCORE_OVERSAMPLING", 2.0)),
+        "on_disk": os.getenv("QDRANT_ON_DISK", "false").lower() == "true",
+        "vector_datatype": os.getenv("QDRANT_VECTOR_DATATYPE", "float32"),
+    }
+    if vector_store == "qdrant_local":
+        return {**options, "qdrant_location": os.getenv("VECTOR_STORE_PATH", str(data_path / "qdrant_local"))}
+    if vector_store != "qdrant":
+        raise ValueError(f"Unknown VECTOR_STORE: {vector_store}")
+    return {
+        **options,
+        "prefer_grpc": os.getenv("QDRANT_PREFER_GRPC", str(prefer_grpc)).lower() == "true",
+        "grpc_port": int(os.getenv("QDRANT_GRPC_PORT", 6334)),
+    }
+
+
+# an embedded Qdrant directory can only be opened by one client per process, so connectors
+# on the same path (dense and hybrid) share it while any of them is alive
+_embedded_clients: weakref.WeakValueDictionary[str, QdrantClient] = weakref.WeakValueDictionary()
+_embedded_clients_lock = threading.Lock()
+
+
+class BaseQdrantConnector:
+    """
+    Ingestion and collection management shared by QdrantConnector and QdrantConnectorHybrid.
+
+    Subclasses set qdrant_client, collection_name, embedding_cache, embedding_model_name,
+    encode_batch_size, upsert_batch_size, upload_workers and max_retries, and implement
+    _create_collection, _build_points and _encode_batch.
+    """
+
+    @staticmethod
+    def _make_clients(
+        host: str, port: int, location: str | None = None, grpc_port: int = 6334, prefer_grpc: bool = False
+    ) -> tuple[QdrantClient, AsyncQdrantClient | None]:
+        """
+        Sync and async clients of a Qdrant server, or only a sync one for Qdrant embedded in this
+        process when location is given: ":memory:" or a directory path
+        """
+        if location == ":memory:":
+            # an embedded instance can't be shared with a second (async) client
+            return QdrantClient(location=":memory:"), None
+        if location:
+            key = str(Path(location).resolve())
+            with _embedded_clients_lock:
+                client = _embedded_clients.get(key)
+                if client is None:
+                    client = _embedded_clients[key] = QdrantClient(path=location)
+            return client, None
+        # with gRPC vectors travel as packed binary floats instead of JSON number lists
+        return (
+            QdrantClient(host=host, port=port, grpc_port=grpc_port, prefer_grpc=prefer_grpc),
+            AsyncQdrantClient(host=host, port=port, grpc_port=grpc_port, prefer_grpc=prefer_grpc),
+        )
+
+    def _create_collection(self):
+        raise NotImplementedError
+
+    def _build_points(self, chunks: list[dict[str, Any]], start_index: int, metadata: dict[str, Any] = None) -> list[PointStruct]:
+        raise NotImplementedError
+
+    def _encode_batch(self, queries: list[str]) -> Iterable[np.ndarray]:
+        """Embeddings of queries, encoded in batches of encode_batch_size"""
+        raise NotImplementedError
+
+    def _create_payload_indexes(self):
+        """Index the filterable payload fields, creating an index that already exists is a no-op"""
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            self.qdrant_client.create_payload_index(
+                collection_name=self.collection_name, field_name=field_name, field_schema=field_schema, wait=True
+            )
+
+    def _collection_exists(self) -> bool:
+        return self.qdrant_client.collection_exists(self.collection_name)
+
+    def _delete_collection(self):
+        self.qdrant_client.delete_collection(collection_name=self.collection_name)
+
     def recreate_collection(self):
-        """Check and create collection in Qdrant if it doesn't exist"""
+        """Delete the collection if it exists and create it from scratch"""
         try:
-            collections = self.qdrant_client.get_collections()
-            collection_names = [col.name for col in collections.collections]
-            if self.collection_name in collection_names:
+            if self._collection_exists():
                 print(f"Collection '{self.collection_name}' already exists, deleting it for fresh start.")
-                self.qdrant_client.delete_collection(collection_name=self.collection_name)
-            vector_size = self.embedding_model.get_sentence_embedding_dimension()
-            
-            self.qdrant_client.create_collection(
-                collection_name=self.collection_name,
-                vectors_config=VectorParams(
-                    size=vector_size,
-                    distance=Distance.COSINE
-                )
-            )
-            print(f"Created collection '{self.collection_name}'")
+                self._delete_collection()
+            self._create_collection()
         except Exception as e:
             print(f"Error creating collection: {e}")
 
+    def ensure_collection(self) -> bool:
+        """Create the collection if it doesn't exist, returns True when it was created"""
+        if self._collection_exists():
+            print(f"Collection '{self.collection_name}' already exists")
+            # collections created before filtering was added get their indexes too
+            self._create_payload_indexes()
+            return False
+        self._create_collection()
+        return True
+
+    @staticmethod
+    def _file_filter(file_name: str) -> Filter:
+        return Filter(must=[FieldCondition(key="file_name", match=MatchValue(value=file_name))])
+
+    def delete_file_points(self, file_name: str) -> None:
+        """Delete all points that were uploaded for given file"""
+        self.qdrant_client.delete(
+            collection_name=self.collection_name,
+            points_selector=FilterSelector(filter=self._file_filter(file_name)),
+            wait=True
+        )
+        print(f"Deleted points of '{file_name}' from Qdrant")
+
+    def set_file_tags(self, file_name: str, tags: list[str]) -> None:
+        """Replace the tags in the payloads of all points of given file, without re-embedding it"""
+        self.qdrant_client.set_payload(
+            collection_name=self.collection_name,
+            payload={"tags": tags},
+            points=self._file_filter(file_name),
+            wait=True
+        )
+        print(f"Updated tags of '{file_name}' in Qdrant")
+
+    @staticmethod
+    def point_id(file_name: str, chunk_index: int) -> str:
+        """Deterministic point id, so re-uploading a file overwrites its points instead of duplicating them"""
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{file_name}#{chunk_index}"))
+
+    def _upsert_batch(self, points: list[PointStruct]) -> int:
+        """Upsert one batch of points, retrying with exponential backoff"""
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self.qdrant_client.upsert(
+                    collection_name=self.collection_name,
+                    points=points,
+                    wait=True
+                )
+                return len(points)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"Error uploading batch to Qdrant (attempt {attempt}/{self.max_retries}): {e}")
+                time.sleep(2 ** (attempt - 1))
+
+    def upload_chunks(
+        self,
+        chunks: Iterable[dict[str, Any]],
+        metadata: dict[str, Any] = None
+    ) -> int:
+        """
+        Embed chunks in batches and upsert them to Qdrant in bulk.
+        Chunks are consumed lazily, so they can come from a streaming generator.
+
+        Args:
+            chunks: Chunks as dicts with "text" and any extra payload (e.g. page_start, char_start)
+            metadata: Additional metadata shared by all chunks (e.g., filename)
+
+        Returns:
+            Number of points uploaded
+
+        Raises:
+            RuntimeError: if some batches still failed after retries (the other batches are uploaded)
+        """
+        uploaded = 0
+        total = 0
+        failed_batches = []
+        pending: list[tuple[int, Future]] = []
+
+        def collect(batch_start: int, future: Future) -> None:
+            nonlocal uploaded
+            try:
+                uploaded += future.result()
+            except Exception as e:
+                print(f"Error uploading chunks {batch_start}-{batch_start + self.upsert_batch_size - 1} to Qdrant: {e}")
+                failed_batches.append(batch_start)
+
+        chunks = iter(chunks)
+        with ThreadPoolExecutor(max_workers=self.upload_workers) as executor:
+            while batch := list(islice(chunks, self.upsert_batch_size)):
+                points = self._build_points(batch, total, metadata)
+                pending.append((total, executor.submit(self._upsert_batch, points)))
+                total += len(batch)
+                # keep at most a couple of encoded batches waiting per worker
+                while len(pending) > 2 * self.upload_workers:
+                    collect(*pending.pop(0))
+            for batch_start, future in pending:
+                collect(batch_start, future)
+
+        print(f"Uploaded {uploaded}/{total} chunks to Qdrant")
+        if failed_batches:
+            raise RuntimeError(f"Failed to upload batches starting at chunk indexes: {failed_batches}")
+        return uploaded
+
     def upload_to_qdrant(
         self, 
         text: str,
         metadata: dict[str, Any] = None
-    ) -> None:
+    ) -> int:
         """
-        Upload chunks and embeddings to Qdrant
+        Split text into chunks, then embed and upload them to Qdrant
         
         Args:
-            chunks: List of text chunks
-            embeddings: Embeddings for chunks
+            text: Text of the document
             metadata: Additional metadata (e.g., filename, page)
         
         Returns:
-            List of IDs of added points
+            Number of points uploaded
         """
-        sentence_chunks = self._get_sentence_splitter(metadata["chunk_size"], metadata["overlap"]).split_text(text)
+        sentence_chunks = get_sentence_splitter(metadata["chunk_size"], metadata["overlap"]).split_text(text)
         print(f"text spliited into {len(sentence_chunks)} chunks")
-        for i, chunk in enumerate(sentence_chunks):
-            point_id = str(uuid.uuid4())
-            embedding = self.embedding_model.encode(chunk)
+        return self.upload_chunks(({"text": chunk} for chunk in sentence_chunks), metadata)
+
+    def encode_queries(self, queries: list[str]) -> list[np.ndarray]:
+        """Embeddings of many queries, the uncached ones encoded in one batch"""
+        embeddings: list[np.ndarray | None] = [
+            self.embedding_cache.get(self.embedding_model_name, query) if self.embedding_cache is not None else None
+            for query in queries
+        ]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            encoded = self._encode_batch([queries[i] for i in missing])
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = embedding
+                if self.embedding_cache is not None:
+                    self.embedding_cache.put(self.embedding_model_name, queries[i], embedding)
+        return embeddings
+
+    def scroll_payloads(self, limit: int = 10_000) -> list[dict[str, Any]]:
+        """Payloads of up to `limit` stored points"""
+        points, _ = self.qdrant_client.scroll(
+            collection_name=self.collection_name, limit=limit, with_payload=True, with_vectors=False
+        )
+        return [point.payload for point in points]
+
+    @staticmethod
+    def _format_results(search_results) -> list[dict]:
+        results = []
+        for result in search_results:
+            results.append({
+                "text": result.payload["text"],
+                "score": result.score,
+                "file_name": result.payload.get("file_name", "unknown"),
+                "chunk_index": result.payload.get("chunk_index", 0),
+                "page_start": result.payload.get("page_start"),
+                "page_end": result.payload.get("page_end"),
+                "char_start": result.payload.get("char_start"),
+                "char_end": result.payload.get("char_end")
+            })
+        return results
+
+
+class QdrantConnector(BaseQdrantConnector):
+      
+    def __init__(
+        self, 
+        qdrant_host: str = "localhost", 
+        qdrant_port: int = 6333,
+        embedding_model: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+        collection_name: str = "pdf_documents",
+        encode_batch_size: int = 64,
+        upsert_batch_size: int = 256,
+        upload_workers: int = 1,
+        max_retries: int = 3,
+        embedding_cache: EmbeddingCache | None = None,
+        query_batch_max_size: int = 0,
+        query_batch_max_wait: float = 0.002,
+        qdrant_location: str | None = None,
+        vector_index_path: str | None = None,
+        quantization: str | None = None,
+        rescore_oversampling: float = 2.0,
+        on_disk: bool = False,
+        vector_datatype: str = "float32",
+        prefer_grpc: bool = False,
+        grpc_port: int = 6334
+    ):
+        # vector_index_path keeps vectors in an in-process NumpyVectorIndex instead of Qdrant
+        self.vector_index = NumpyVectorIndex(vector_index_path) if vector_index_path else None
+        if self.vector_index is not None:
+            self.qdrant_client = None
+            self.async_qdrant_client = None
+        else:
+            self.qdrant_client, self.async_qdrant_client = self._make_clients(
+                qdrant_host, qdrant_port, qdrant_location, grpc_port, prefer_grpc
+            )
+        if quantization not in (None, "scalar", "binary"):
+            raise ValueError(f"Unknown quantization: {quantization}")
+        if vector_datatype not in ("float32", "float16"):
+            raise ValueError(f"Unknown vector datatype: {vector_datatype}")
+        self.quantization = quantization
+        self.rescore_oversampling = rescore_oversampling
+        self.on_disk = on_disk
+        self.vector_datatype = vector_datatype
+        self.embedding_model = SentenceTransformer(embedding_model)
+        self.embedding_model_name = embedding_model
+        self.collection_name = collection_name
+        self.encode_batch_size = encode_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.upload_workers = upload_workers
+        self.max_retries = max_retries
+        self.embedding_cache = embedding_cache
+        # micro-batching of concurrent query encodes, disabled when query_batch_max_size < 2
+        self.query_batcher = EmbeddingBatcher(
+            self.embedding_model, query_batch_max_size, query_batch_max_wait
+        ) if query_batch_max_size > 1 else None
+
+    def _create_collection(self):
+        vector_size = self.embedding_model.get_sentence_embedding_dimension()
+        if self.vector_index is not None:
+            self.vector_index.create(vector_size)
+            print(f"Created vector index in '{self.vector_index.path}'")
+            return
+        self.qdrant_client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=VectorParams(
+                size=vector_size,
+                distance=Distance.COSINE,
+                on_disk=self.on_disk,
+                datatype=Datatype.FLOAT16 if self.vector_datatype == "float16" else Datatype.FLOAT32
+            ),
+            quantization_config=self._quantization_config()
+        )
+        self._create_payload_indexes()
+        print(
+            f"Created collection '{self.collection_name}' "
+            f"(quantization={self.quantization}, on_disk={self.on_disk}, datatype={self.vector_datatype})"
+        )
 
+    def _create_payload_indexes(self):
+        # the vector index filters by scanning payloads
+        if self.vector_index is None:
+            super()._create_payload_indexes()
+
+    def _quantization_config(self) -> ScalarQuantization | BinaryQuantization | None:
+        # quantized vectors stay in RAM for the first pass, originals can live on disk for rescoring
+        if self.quantization == "scalar":
+            return ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+            )
+        if self.quantization == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    def _search_params(self, exact: bool = False) -> SearchParams | None:
+        """Search over quantized vectors, then rescore the oversampled candidates with the originals"""
+        if exact:
+            return SearchParams(exact=True, quantization=QuantizationSearchParams(ignore=True))
+        if self.quantization is None:
+            return None
+        return SearchParams(
+            quantization=QuantizationSearchParams(rescore=True, oversampling=self.rescore_oversampling)
+        )
+
+    def _collection_exists(self) -> bool:
+        if self.vector_index is not None:
+            return self.vector_index.exists()
+        return super()._collection_exists()
+
+    def _delete_collection(self):
+        # creating the vector index drops its points
+        if self.vector_index is None:
+            super()._delete_collection()
+
+    def delete_file_points(self, file_name: str) -> None:
+        """Delete all points that were uploaded for given file"""
+        if self.vector_index is not None:
+            self.vector_index.delete(lambda payload: payload.get("file_name") == file_name)
+            self.vector_index.save()
+            print(f"Deleted points of '{file_name}' from the vector index")
+            return
+        super().delete_file_points(file_name)
+
+    def set_file_tags(self, file_name: str, tags: list[str]) -> None:
+        if self.vector_index is not None:
+            self.vector_index.set_payload(lambda payload: payload.get("file_name") == file_name, {"tags": tags})
+            self.vector_index.save()
+            print(f"Updated tags of '{file_name}' in the vector index")
+            return
+        super().set_file_tags(file_name, tags)
+
+    def _upsert_batch(self, points: list[PointStruct]) -> int:
+        if self.vector_index is not None:
+            self.vector_index.upsert(
+                [point.id for point in points], np.array([point.vector for point in points]),
+                [point.payload for point in points]
+            )
+            return len(points)
+        return super()._upsert_batch(points)
+
+    def _build_points(self, chunks: list[dict[str, Any]], start_index: int, metadata: dict[str, Any] = None) -> list[PointStruct]:
+        embeddings = self.embedding_model.encode(
+            [chunk["text"] for chunk in chunks],
+            batch_size=self.encode_batch_size,
+            convert_to_numpy=True
+        )
+        file_name = (metadata or {}).get("file_name")
+        points = []
+        for offset, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+            chunk_index = start_index + offset
             payload = {
-                "text": chunk,
-                "chunk_index": i,
-                "chunk_length": len(chunk)
+                **chunk,
+                "chunk_index": chunk_index,
+                "chunk_length": len(chunk["text"])
             }
             if metadata:
                 payload.update(metadata)
-
-            point = PointStruct(
-                id=point_id,
+            points.append(PointStruct(
+                id=self.point_id(file_name, chunk_index) if file_name else str(uuid.uuid4()),
                 vector=embedding.tolist(),
                 payload=payload
-            )
-            try:
-                self.qdrant_client.upsert(
-                    collection_name=self.collection_name,
-                    points=[point]
-                )
-                print(f"Uploaded point {point_id} to Qdrant")
-            except Exception as e:
-                print(f"Error uploading to Qdrant: {e}")
-                return None
+            ))
+        return points
+
+    def upload_chunks(self, chunks: Iterable[dict[str, Any]], metadata: dict[str, Any] = None) -> int:
+        try:
+            return super().upload_chunks(chunks, metadata)
+        finally:
+            if self.vector_index is not None:
+                self.vector_index.save()
 
-    def search_similar(self, query: str, limit: int = 5) -> list[dict]:
+    def encode_query(self, query: str) -> np.ndarray:
+        if self.embedding_cache is not None:
+            cached = self.embedding_cache.get(self.embedding_model_name, query)
+            if cached is not None:
+                return cached
+        if self.query_batcher is not None:
+            embedding = self.query_batcher.encode(query)
+        else:
+            embedding = self.embedding_model.encode([query])[0]
+        if self.embedding_cache is not None:
+            self.embedding_cache.put(self.embedding_model_name, query, embedding)
+        return embedding
+
+    def _encode_batch(self, queries: list[str]) -> Iterable[np.ndarray]:
+        return self.embedding_model.encode(queries, batch_size=self.encode_batch_size)
+
+    def scroll_payloads(self, limit: int = 10_000) -> list[dict[str, Any]]:
+        """Payloads of up to `limit` stored points"""
+        if self.vector_index is not None:
+            return self.vector_index.payloads[:limit]
+        return super().scroll_payloads(limit)
+
+    @staticmethod
+    def _predicate(search_filter: SearchFilter | None):
+        return search_filter.matches if search_filter and not search_filter.is_empty() else None
+
+    def search_similar(
+        self,
+        query: str,
+        limit: int = 5,
+        query_embedding=None,
+        exact: bool = False,
+        search_filter: SearchFilter | None = None
+    ) -> list[dict]:
             """
             Search for similar chunks to query
             
             Args:
                 query: Text query
                 limit: Maximum number of results
+                query_embedding: Already computed embedding of the query, if available
+                exact: Full scan over original vectors, bypassing the index and quantization
+                search_filter: Only search chunks matching it
             
             Returns:
                 List of similar chunks with metadata
             """
             # Create embedding for query
-            query_embedding = self.embedding_model.encode([query])[0]
+            if query_embedding is None:
+                query_embedding = self.encode_query(query)
             
+            if self.vector_index is not None:
+                return self._format_results(
+                    self.vector_index.search(query_embedding, limit, self._predicate(search_filter))
+                )
+
             # Search in Qdrant
             search_results = self.qdrant_client.search(
                 collection_name=self.collection_name,
                 query_vector=query_embedding.tolist(),
-                limit=limit
+                query_filter=search_filter.to_qdrant() if search_filter else None,
+                limit=limit,
+                search_params=self._search_params(exact)
             )
             
-            results = []
-            for result in search_results:
-                results.append({
-                    "text": result.payload["text"],
-                    "score": result.score,
-                    "file_name": result.payload.get("file_name", "unknown"),
-                    "chunk_index": result.payload.get("chunk_index", 0)
-                })
-            
-            return results
+            return self._format_results(search_results)
+
+    def search_similar_batch(
+        self,
+        queries: list[str],
+        limit: int = 5,
+        query_embeddings=None,
+        search_filter: SearchFilter | None = None
+    ) -> list[list[dict]]:
+            """
+            search_similar for many queries: one batched encode and one Qdrant request for all of them
+
+            Returns:
+                List of results per query, in the order of queries
+            """
+            if query_embeddings is None:
+                query_embeddings = self.encode_queries(queries)
+            if self.vector_index is not None:
+                predicate = self._predicate(search_filter)
+                return [
+                    self._format_results(self.vector_index.search(embedding, limit, predicate))
+                    for embedding in query_embeddings
+                ]
+            batch_results = self.qdrant_client.search_batch(
+                collection_name=self.collection_name,
+                requests=[
+                    SearchRequest(
+                        vector=embedding.tolist(),
+                        filter=search_filter.to_qdrant() if search_filter else None,
+                        limit=limit,
+                        with_payload=True,
+                        params=self._search_params()
+                    )
+                    for embedding in query_embeddings
+                ]
+            )
+            return [self._format_results(results) for results in batch_results]
+
+    async def search_similar_async(
+        self, query: str, limit: int = 5, query_embedding=None, search_filter: SearchFilter | None = None
+    ) -> list[dict]:
+            """
+            Non-blocking version of search_similar for the asyncio request path.
+            Encoding runs in a worker thread, the search goes through AsyncQdrantClient.
+            """
+            if self.async_qdrant_client is None:
+                return await asyncio.to_thread(
+                    self.search_similar, query, limit, query_embedding, search_filter=search_filter
+                )
+            if query_embedding is None:
+                query_embedding = await asyncio.to_thread(self.encode_query, query)
+            search_results = await self.async_qdrant_client.search(
+                collection_name=self.collection_name,
+                query_vector=query_embedding.tolist(),
+                query_filter=search_filter.to_qdrant() if search_filter else None,
+                limit=limit,
+                search_params=self._search_params()
+            )
+            return self._format_results(search_results)
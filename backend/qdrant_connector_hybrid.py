@@ -1,132 +1,209 @@
-from qdrant_client import QdrantClient
 from qdrant_client import models
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from typing import Any
+from fastembed import TextEmbedding, SparseTextEmbedding
+from typing import Any, Iterable
+import asyncio
+import numpy as np
 import uuid
 
+try:
+    from .qdrant_connector import BaseQdrantConnector
+except ImportError:
+    # imported by the scripts in backend/ (injest.py, benchmark_retrieval.py) without the package
+    from qdrant_connector import BaseQdrantConnector
+
+
+class QdrantConnectorHybrid(BaseQdrantConnector):
+    """
+    Hybrid retrieval: dense embeddings + BM25 sparse vectors in one collection.
+
+    Both vectors are computed client-side with fastembed, in batches during ingestion.
+    Searches prefetch candidates from both vectors and fuse them server-side with
+    reciprocal rank fusion ("rrf") or distribution-based score fusion ("dbsf").
+    Upload and search methods have the same interface as QdrantConnector.
+    """
+
+    DENSE_VECTOR = "dense"
+    SPARSE_VECTOR = "bm25"
+    SPARSE_MODEL = "Qdrant/bm25"
 
-class QdrantConnectorHybrid:
-      
     def __init__(
-        self, 
-        qdrant_host: str = "localhost", 
+        self,
+        qdrant_host: str = "localhost",
         qdrant_port: int = 6333,
         embedding_model: str = "jinaai/jina-embeddings-v2-small-en",
-        collection_name: str = "pdf_documents"
+        collection_name: str = "pdf_documents_sparse_and_dense",
+        encode_batch_size: int = 64,
+        upsert_batch_size: int = 64,
+        upload_workers: int = 1,
+        max_retries: int = 3,
+        fusion: str = "rrf",
+        dense_prefetch_limit: int = 20,
+        sparse_prefetch_limit: int = 20,
+        embedding_cache=None,
+        qdrant_location: str | None = None,
+        prefer_grpc: bool = False,
+        grpc_port: int = 6334
     ):
-        self.qdrant_client = QdrantClient(host=qdrant_host, port=qdrant_port)
-        self.embedding_model = embedding_model
+        self.qdrant_client, self.async_qdrant_client = self._make_clients(
+            qdrant_host, qdrant_port, qdrant_location, grpc_port, prefer_grpc
+        )
+        if fusion not in ("rrf", "dbsf"):
+            raise ValueError(f"Unknown fusion: {fusion}")
+        self.dense_model = TextEmbedding(model_name=embedding_model)
+        self.sparse_model = SparseTextEmbedding(model_name=self.SPARSE_MODEL)
+        self.embedding_model_name = embedding_model
         self.collection_name = collection_name
-        self._ensure_collection_exists()
-
-    @property
-    def sentence_splitter(self):
-        return RecursiveCharacterTextSplitter(
-            chunk_size=500,     # Number of characters per chunk
-            chunk_overlap=50,   # Overlap to maintain context
-            separators=["\n\n", "\n", ".", " "]  # Prioritize splitting on paragraph, newline, and sentence boundaries
+        self.encode_batch_size = encode_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.upload_workers = upload_workers
+        self.max_retries = max_retries
+        self.fusion = fusion
+        self.dense_prefetch_limit = dense_prefetch_limit
+        self.sparse_prefetch_limit = sparse_prefetch_limit
+        self.embedding_cache = embedding_cache
+        self.query_batcher = None
+
+    def _create_collection(self):
+        vector_size = len(self.encode_query("dimension"))
+        self.qdrant_client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config={
+                self.DENSE_VECTOR: models.VectorParams(
+                    size=vector_size,
+                    distance=models.Distance.COSINE,
+                ),
+            },
+            sparse_vectors_config={
+                # fastembed BM25 gives term frequencies, Qdrant applies IDF over the collection
+                self.SPARSE_VECTOR: models.SparseVectorParams(
+                    modifier=models.Modifier.IDF,
+                )
+            }
         )
-    
-    def _ensure_collection_exists(self):
-        """Check and create collection in Qdrant if it doesn't exist"""
-        try:
-            collections = self.qdrant_client.get_collections()
-            collection_names = [col.name for col in collections.collections]
-            
-            if self.collection_name not in collection_names:
-        
-                self.qdrant_client.create_collection(
-                    collection_name="pdf_documents_sparse_and_dense",
-                    vectors_config={
-                        # Named dense vector for jinaai/jina-embeddings-v2-small-en
-                        "jina-small": models.VectorParams(
-                            size=512,
-                            distance=models.Distance.COSINE,
-                        ),
-                    },
-                    sparse_vectors_config={
-                        "bm25": models.SparseVectorParams(
-                            modifier=models.Modifier.IDF,
-                        )
-                    }
-)
-                print(f"Created collection '{self.collection_name}'")
-            else:
-                print(f"Collection '{self.collection_name}' already exists")
-        except Exception as e:
-            print(f"Error creating collection: {e}")
-
-    def upload_to_qdrant(
-        self, 
-        text: str,
-        metadata: dict[str, Any] = None
-    ) -> None:
-        """
-        Upload chunks and embeddings to Qdrant
-        
-        Args:
-            chunks: List of text chunks
-            embeddings: Embeddings for chunks
-            metadata: Additional metadata (e.g., filename, page)
-        
-        Returns:
-            List of IDs of added points
-        """
-        sentence_chunks = self.sentence_splitter.split_text(text)
-        print(f"text spliited into {len(sentence_chunks)} chunks")
-        for i, chunk in enumerate(sentence_chunks):
-            point_id = str(uuid.uuid4())
+        self._create_payload_indexes()
+        print(f"Created collection '{self.collection_name}'")
+
+    def _build_points(
+        self, chunks: list[dict[str, Any]], start_index: int, metadata: dict[str, Any] = None
+    ) -> list[models.PointStruct]:
+        texts = [chunk["text"] for chunk in chunks]
+        dense_embeddings = self.dense_model.embed(texts, batch_size=self.encode_batch_size)
+        sparse_embeddings = self.sparse_model.embed(texts, batch_size=self.encode_batch_size)
+        file_name = (metadata or {}).get("file_name")
+        points = []
+        for offset, (chunk, dense, sparse) in enumerate(zip(chunks, dense_embeddings, sparse_embeddings)):
+            chunk_index = start_index + offset
             payload = {
-                "text": chunk,
-                "chunk_index": i,
-                "chunk_length": len(chunk)
+                **chunk,
+                "chunk_index": chunk_index,
+                "chunk_length": len(chunk["text"])
             }
             if metadata:
                 payload.update(metadata)
-            try:
-                self.qdrant_client.upsert(
-                    collection_name=self.collection_name,
-                    points=[
-                        models.PointStruct(
-                            id=uuid.uuid4().hex,
-                            vector={
-                                "jina-small": models.Document(
-                                    text=chunk,
-                                    model=self.embedding_model,
-                                ),
-                                "bm25": models.Document(
-                                    text=chunk, 
-                                    model="Qdrant/bm25",
-                                ),
-                            },
-                            payload=payload
-                        )
-                    ]
-                )
-                print(f"Uploaded point {point_id} to Qdrant")
-            except Exception as e:
-                print(f"Error uploading to Qdrant: {e}")
-                return None
-
-    def search_similar(self, query: str, limit: int = 5) -> list[str]:
-            results = self.qdrant_client.query_points(
-                collection_name=self.collection_name,
-                prefetch=[
-                    models.Prefetch(
-                        query=models.Document(
-                            text=query,
-                            model=self.embedding_model,
-                        ),
-                        using="jina-small",
-                        limit=(10 * limit),
+            points.append(models.PointStruct(
+                id=self.point_id(file_name, chunk_index) if file_name else str(uuid.uuid4()),
+                vector={
+                    self.DENSE_VECTOR: dense.tolist(),
+                    self.SPARSE_VECTOR: models.SparseVector(
+                        indices=sparse.indices.tolist(), values=sparse.values.tolist()
                     ),
-                ],
-                query=models.Document(
-                    text=query,
-                    model="Qdrant/bm25", 
+                },
+                payload=payload
+            ))
+        return points
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """Dense embedding of the query (used for the answer cache too), the sparse one is computed in search"""
+        if self.embedding_cache is not None:
+            cached = self.embedding_cache.get(self.embedding_model_name, query)
+            if cached is not None:
+                return cached
+        embedding = next(iter(self.dense_model.query_embed(query)))
+        if self.embedding_cache is not None:
+            self.embedding_cache.put(self.embedding_model_name, query, embedding)
+        return embedding
+
+    def _encode_batch(self, queries: list[str]) -> Iterable[np.ndarray]:
+        return self.dense_model.query_embed(queries, batch_size=self.encode_batch_size)
+
+    def _encode_sparse_query(self, query: str) -> models.SparseVector:
+        sparse = next(iter(self.sparse_model.query_embed(query)))
+        return models.SparseVector(indices=sparse.indices.tolist(), values=sparse.values.tolist())
+
+    def _query_args(
+        self, query_embedding: np.ndarray, sparse_embedding: models.SparseVector, limit: int, search_filter=None
+    ) -> dict:
+        # filtering the prefetches is enough, only their candidates get fused
+        query_filter = search_filter.to_qdrant() if search_filter else None
+        return {
+            "collection_name": self.collection_name,
+            "prefetch": [
+                models.Prefetch(
+                    query=query_embedding.tolist(),
+                    using=self.DENSE_VECTOR,
+                    filter=query_filter,
+                    limit=max(self.dense_prefetch_limit, limit),
+                ),
+                models.Prefetch(
+                    query=sparse_embedding,
+                    using=self.SPARSE_VECTOR,
+                    filter=query_filter,
+                    limit=max(self.sparse_prefetch_limit, limit),
                 ),
-                using="bm25",
-                limit=limit,
-                with_payload=True,
-            ) 
-            return [result.payload["text"] for result in  results.points]
+            ],
+            "query": models.FusionQuery(fusion=models.Fusion.DBSF if self.fusion == "dbsf" else models.Fusion.RRF),
+            "limit": limit,
+            "with_payload": True,
+        }
+
+    def search_similar(self, query: str, limit: int = 5, query_embedding=None, search_filter=None) -> list[dict]:
+        """
+        Hybrid search for chunks similar to query, fused from dense and BM25 candidates
+
+        Args:
+            query: Text query
+            limit: Maximum number of results
+            query_embedding: Already computed dense embedding of the query, if available
+            search_filter: SearchFilter, only search chunks matching it
+
+        Returns:
+            List of similar chunks with metadata, the score is the fusion score
+        """
+        if query_embedding is None:
+            query_embedding = self.encode_query(query)
+        results = self.qdrant_client.query_points(
+            **self._query_args(query_embedding, self._encode_sparse_query(query), limit, search_filter)
+        )
+        return self._format_results(results.points)
+
+    def search_similar_batch(
+        self, queries: list[str], limit: int = 5, query_embeddings=None, search_filter=None
+    ) -> list[list[dict]]:
+        """search_similar for many queries: batched encoding and one query_batch_points request for all of them"""
+        if query_embeddings is None:
+            query_embeddings = self.encode_queries(queries)
+        sparse_embeddings = [
+            models.SparseVector(indices=sparse.indices.tolist(), values=sparse.values.tolist())
+            for sparse in self.sparse_model.query_embed(queries, batch_size=self.encode_batch_size)
+        ]
+        requests = []
+        for embedding, sparse_embedding in zip(query_embeddings, sparse_embeddings):
+            args = self._query_args(embedding, sparse_embedding, limit, search_filter)
+            del args["collection_name"]
+            requests.append(models.QueryRequest(**args))
+        batch_results = self.qdrant_client.query_batch_points(collection_name=self.collection_name, requests=requests)
+        return [self._format_results(results.points) for results in batch_results]
+
+    async def search_similar_async(
+        self, query: str, limit: int = 5, query_embedding=None, search_filter=None
+    ) -> list[dict]:
+        """Non-blocking version of search_similar, encoding runs in a worker thread"""
+        if self.async_qdrant_client is None:
+            return await asyncio.to_thread(self.search_similar, query, limit, query_embedding, search_filter)
+        if query_embedding is None:
+            query_embedding = await asyncio.to_thread(self.encode_query, query)
+        sparse_embedding = await asyncio.to_thread(self._encode_sparse_query, query)
+        results = await self.async_qdrant_client.query_points(
+            **self._query_args(query_embedding, sparse_embedding, limit, search_filter)
+        )
+        return self._format_results(results.points)
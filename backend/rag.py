@@ -1,80 +1,389 @@
-from .qdrant_connector import QdrantConnector
-import os
-import ollama
+from .registry import (
+    get_retriever, get_llm_router, get_model_semaphore, get_answer_cache, get_reranker,
+    get_context_budget, get_token_counter, generate_options, search_limit, RETRIEVAL_MODE
+)
+from .context_assembler import assemble_context
+from .qdrant_connector import SearchFilter
+from .metrics import stage, record_stage, record_cache_hit, record_llm_response, track_request
+import asyncio
 import json
 import re
+from time import perf_counter
+from typing import AsyncIterator
 from ollama import GenerateResponse
 
-OLLAMA_HOST = os.getenv("OLLAMA_HOST")
-OLLAMA_PORT = os.getenv("OLLAMA_PORT")
+# Static instructions go to the system prompt and variable data to the end of the prompt, so every
+# request of a model starts with the same tokens and Ollama can reuse their KV cache.
+SYSTEM_PROMPT = """
+    /no_think
+    You're a pdf research assistant. Answer the QUESTION based on the CONTEXT from the Qdrant database.
+    Use only the facts from the CONTEXT when answering the QUESTION.
+""".strip()
 
-def build_prompt(query, search_results):
-    prompt_template = """
-        /no_think
-        You're a pdf research assistant. Answer the QUESTION based on the CONTEXT from the Qdrant database.
-        Use only the facts from the CONTEXT when answering the QUESTION.
+EVALUATION_SYSTEM_PROMPT = """
+    /no_think
+    You are an expert evaluator for a RAG system.
+    Your task is to analyze the relevance of the generated answer to the given question.
+    Based on the relevance of the generated answer, you will classify it
+    as "NON_RELEVANT", "PARTLY_RELEVANT", or "RELEVANT".
 
-        QUESTION: {question}
+    Please analyze the content and context of the generated answer in relation to the question
+    and provide your evaluation in parsable JSON without using code blocks:
+
+    {
+    "Relevance": "NON_RELEVANT" | "PARTLY_RELEVANT" | "RELEVANT",
+    "Explanation": "[Provide a brief explanation for your evaluation]"
+    }
+""".strip()
+
+BATCH_EVALUATION_SYSTEM_PROMPT = """
+    /no_think
+    You are an expert evaluator for a RAG system.
+    Your task is to analyze the relevance of each generated answer to its question.
+    Based on the relevance of the generated answer, you will classify it
+    as "NON_RELEVANT", "PARTLY_RELEVANT", or "RELEVANT".
 
-        CONTEXT: x
+    Please analyze each pair separately and provide your evaluation in parsable JSON without using code blocks,
+    as a list with one object per pair, in the same order:
+
+    [
+      {
+      "Id": <number of the pair>,
+      "Relevance": "NON_RELEVANT" | "PARTLY_RELEVANT" | "RELEVANT",
+      "Explanation": "[Provide a brief explanation for your evaluation]"
+      }
+    ]
+""".strip()
+
+def build_prompt(query, context):
+    prompt_template = """
+        CONTEXT:
         {context}
+
+        QUESTION: {question}
     """.strip()
 
-    prompt = prompt_template.format(question=query, context=search_results).strip()
+    prompt = prompt_template.format(question=query, context=context).strip()
     return prompt
 
+def build_rag_prompt(query: str, search_results: list[dict], model: str) -> str:
+    """Prompt with the search results assembled into a compact context that fits the model's token budget"""
+    context = assemble_context(search_results, get_context_budget(model), get_token_counter(model))
+    return build_prompt(query, context)
+
 def build_evaluation_prompt(query, answer_llm):
     evaluation_prompt_template = """
-        /no_think
-        You are an expert evaluator for a RAG system.
-        Your task is to analyze the relevance of the generated answer to the given question.
-        Based on the relevance of the generated answer, you will classify it
-        as "NON_RELEVANT", "PARTLY_RELEVANT", or "RELEVANT".
-
         Here is the data for evaluation:
 
         Question: {question}
         Generated Answer: {answer_llm}
-
-        Please analyze the content and context of the generated answer in relation to the question
-        and provide your evaluation in parsable JSON without using code blocks:
-
-        {{
-        "Relevance": "NON_RELEVANT" | "PARTLY_RELEVANT" | "RELEVANT",
-        "Explanation": "[Provide a brief explanation for your evaluation]"
-        }}
         """.strip()
     evaluation_prompt = evaluation_prompt_template.format(question=query, answer_llm=answer_llm).strip()
     return evaluation_prompt
 
+def build_batch_evaluation_prompt(items: list[tuple[str, str]]):
+    batch_evaluation_prompt_template = """
+        Here is the data for evaluation:
+
+        {items}
+        """.strip()
+    formatted_items = "\n\n".join(
+        f"Pair {i}:\nQuestion: {question}\nGenerated Answer: {answer_llm}"
+        for i, (question, answer_llm) in enumerate(items, start=1)
+    )
+    return batch_evaluation_prompt_template.format(items=formatted_items).strip()
+
 def clean_qwen_response(text):
     cleaned = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
     cleaned = re.sub(r'\n\s*\n+', '\n\n', cleaned).strip()
     return cleaned
 
-def rag(query: str, model: str) -> GenerateResponse:
-    qdrant_connector = QdrantConnector(qdrant_host=os.getenv("QDRANT_HOST"))
+class ThinkStripper:
+    """Removes <think>...</think> blocks from a token stream, also when tags are split across tokens"""
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self.buffer = ""
+        self.in_think = False
+
+    @staticmethod
+    def _partial_tag_length(text: str, tag: str) -> int:
+        """Length of the longest suffix of text that is a prefix of tag"""
+        for length in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:length]):
+                return length
+        return 0
+
+    def feed(self, token: str) -> str:
+        self.buffer += token
+        output = []
+        while self.buffer:
+            tag = self.CLOSE_TAG if self.in_think else self.OPEN_TAG
+            index = self.buffer.find(tag)
+            if index >= 0:
+                if not self.in_think:
+                    output.append(self.buffer[:index])
+                self.buffer = self.buffer[index + len(tag):]
+                self.in_think = not self.in_think
+                continue
+            keep = self._partial_tag_length(self.buffer, tag)
+            if not self.in_think:
+                output.append(self.buffer[:len(self.buffer) - keep])
+            self.buffer = self.buffer[len(self.buffer) - keep:]
+            break
+        return "".join(output)
+
+    def flush(self) -> str:
+        rest = "" if self.in_think else self.buffer
+        self.buffer = ""
+        return rest
+
+def answer_cache_key(model: str, retrieval_mode: str | None, search_filter: SearchFilter | None = None) -> str:
+    """Answers are cached per model, and per retrieval mode and search filter when they're not the default ones"""
+    key = model
+    if retrieval_mode not in (None, RETRIEVAL_MODE):
+        key = f"{key}|{retrieval_mode}"
+    if search_filter is not None and not search_filter.is_empty():
+        key = f"{key}|{search_filter.key()}"
+    return key
+
+def rag(
+    query: str, model: str, retrieval_mode: str | None = None, search_filter: SearchFilter | None = None
+) -> GenerateResponse:
+    qdrant_connector = get_retriever(retrieval_mode)
+    cache_key = answer_cache_key(model, retrieval_mode, search_filter)
+    with stage("embedding"):
+        query_embedding = qdrant_connector.encode_query(query)
+    answer_cache = get_answer_cache()
+    if answer_cache:
+        with stage("answer_cache"):
+            cached = answer_cache.get(query, cache_key, query_embedding)
+        if cached is not None:
+            print("Answer found in cache")
+            record_cache_hit()
+            return cached
     print("Searching in qdrant db")
-    search_result = qdrant_connector.search_similar(query=query)
-    ollama_host = f"http://{OLLAMA_HOST}:{OLLAMA_PORT}"
-    client = ollama.Client(host=ollama_host)
-    prompt = build_prompt(query, search_result)
+    with stage("search"):
+        search_result = qdrant_connector.search_similar(
+            query=query, limit=search_limit(), query_embedding=query_embedding, search_filter=search_filter
+        )
+    if reranker := get_reranker():
+        with stage("rerank"):
+            search_result = reranker.rerank(query, search_result)
+    with stage("prompt"):
+        prompt = build_rag_prompt(query, search_result, model)
     print(prompt)
-    response = client.generate(
-        model=model,
-        prompt=prompt
-        
-    )
+    with stage("llm"):
+        response = get_llm_router().generate(
+            model=model,
+            system=SYSTEM_PROMPT,
+            prompt=prompt,
+            **generate_options(model)
+        )
+    record_llm_response(response)
+    if answer_cache:
+        answer_cache.put(query, cache_key, query_embedding, response)
+    return response
+
+async def rag_async(
+    query: str, model: str, retrieval_mode: str | None = None, search_filter: SearchFilter | None = None
+) -> GenerateResponse:
+    """Same as rag(), but doesn't block the event loop while waiting for Qdrant and Ollama"""
+    qdrant_connector = get_retriever(retrieval_mode)
+    cache_key = answer_cache_key(model, retrieval_mode, search_filter)
+    with stage("embedding"):
+        query_embedding = await asyncio.to_thread(qdrant_connector.encode_query, query)
+    answer_cache = get_answer_cache()
+    if answer_cache:
+        with stage("answer_cache"):
+            cached = answer_cache.get(query, cache_key, query_embedding)
+        if cached is not None:
+            print("Answer found in cache")
+            record_cache_hit()
+            return cached
+    print("Searching in qdrant db")
+    with stage("search"):
+        search_result = await qdrant_connector.search_similar_async(
+            query=query, limit=search_limit(), query_embedding=query_embedding, search_filter=search_filter
+        )
+    if reranker := get_reranker():
+        with stage("rerank"):
+            search_result = await asyncio.to_thread(reranker.rerank, query, search_result)
+    with stage("prompt"):
+        # the first call per model loads the tokenizer
+        prompt = await asyncio.to_thread(build_rag_prompt, query, search_result, model)
+    print(prompt)
+    with stage("llm_queue"):
+        await get_model_semaphore(model).acquire()
+    try:
+        with stage("llm"):
+            response = await get_llm_router().generate_async(
+                model=model,
+                system=SYSTEM_PROMPT,
+                prompt=prompt,
+                **generate_options(model)
+            )
+    finally:
+        get_model_semaphore(model).release()
+    record_llm_response(response)
+    if answer_cache:
+        answer_cache.put(query, cache_key, query_embedding, response)
     return response
 
+async def rag_stream(
+    query: str, model: str, retrieval_mode: str | None = None, search_filter: SearchFilter | None = None
+) -> AsyncIterator[str]:
+    """Like rag_async(), but yields the answer tokens as Ollama generates them"""
+    qdrant_connector = get_retriever(retrieval_mode)
+    cache_key = answer_cache_key(model, retrieval_mode, search_filter)
+    with stage("embedding"):
+        query_embedding = await asyncio.to_thread(qdrant_connector.encode_query, query)
+    answer_cache = get_answer_cache()
+    if answer_cache:
+        with stage("answer_cache"):
+            cached = answer_cache.get(query, cache_key, query_embedding)
+        if cached is not None:
+            print("Answer found in cache")
+            record_cache_hit()
+            yield cached.response
+            return
+    print("Searching in qdrant db")
+    with stage("search"):
+        search_result = await qdrant_connector.search_similar_async(
+            query=query, limit=search_limit(), query_embedding=query_embedding, search_filter=search_filter
+        )
+    if reranker := get_reranker():
+        with stage("rerank"):
+            search_result = await asyncio.to_thread(reranker.rerank, query, search_result)
+    with stage("prompt"):
+        # the first call per model loads the tokenizer
+        prompt = await asyncio.to_thread(build_rag_prompt, query, search_result, model)
+    print(prompt)
+    parts = []
+    with stage("llm_queue"):
+        await get_model_semaphore(model).acquire()
+    try:
+        llm_start = perf_counter()
+        first_part = True
+        stream = get_llm_router().generate_stream(
+            model=model, system=SYSTEM_PROMPT, prompt=prompt, **generate_options(model)
+        )
+        async for part in stream:
+            if first_part:
+                record_stage("llm_first_token", perf_counter() - llm_start)
+                first_part = False
+            parts.append(part.response)
+            if part.done:
+                record_stage("llm", perf_counter() - llm_start)
+                record_llm_response(part)
+            yield part.response
+    finally:
+        get_model_semaphore(model).release()
+    if answer_cache:
+        answer_cache.put(query, cache_key, query_embedding, GenerateResponse(model=model, response="".join(parts), done=True))
+
+async def rag_batch(
+    queries: list[str],
+    model: str,
+    retrieval_mode: str | None = None,
+    concurrency: int = 4,
+    search_filter: SearchFilter | None = None
+) -> AsyncIterator[dict]:
+    """
+    Answers for many questions, yielded as they are ready (cached ones first), each with its index
+    in queries and its timings. All queries are embedded in one batch and searched with one Qdrant
+    request; at most `concurrency` of them are then reranked/generated at a time.
+    """
+    qdrant_connector = get_retriever(retrieval_mode)
+    cache_key = answer_cache_key(model, retrieval_mode, search_filter)
+    answer_cache = get_answer_cache()
+
+    def item(index: int, response: GenerateResponse, timings: dict, cached: bool) -> dict:
+        return {
+            "index": index,
+            "question": queries[index],
+            "answer": clean_qwen_response(response.response),
+            "cached": cached,
+            # since the start of the batch
+            "response_time": perf_counter() - batch_start,
+            "timings": timings,
+        }
+
+    batch_start = start = perf_counter()
+    query_embeddings = await asyncio.to_thread(qdrant_connector.encode_queries, queries)
+    embedding_time = perf_counter() - start
+    pending = []
+    for index, (query, query_embedding) in enumerate(zip(queries, query_embeddings)):
+        cached = answer_cache.get(query, cache_key, query_embedding) if answer_cache else None
+        if cached is not None:
+            yield item(index, cached, {"stages": {"embedding": embedding_time}}, cached=True)
+        else:
+            pending.append(index)
+    if not pending:
+        return
+
+    start = perf_counter()
+    search_results = await asyncio.to_thread(
+        qdrant_connector.search_similar_batch,
+        [queries[index] for index in pending],
+        search_limit(),
+        [query_embeddings[index] for index in pending],
+        search_filter
+    )
+    # embedding and search are shared by the whole batch, every item reports their full duration
+    shared_stages = {"embedding": embedding_time, "search": perf_counter() - start}
+    slots = asyncio.Semaphore(concurrency)
+
+    async def answer(index: int, search_result: list[dict]) -> dict:
+        query = queries[index]
+        async with slots:
+            with track_request(model) as timings:
+                try:
+                    if reranker := get_reranker():
+                        with stage("rerank"):
+                            search_result = await asyncio.to_thread(reranker.rerank, query, search_result)
+                    with stage("prompt"):
+                        prompt = await asyncio.to_thread(build_rag_prompt, query, search_result, model)
+                    with stage("llm_queue"):
+                        await get_model_semaphore(model).acquire()
+                    try:
+                        with stage("llm"):
+                            response = await get_llm_router().generate_async(
+                                model=model,
+                                system=SYSTEM_PROMPT,
+                                prompt=prompt,
+                                **generate_options(model)
+                            )
+                    finally:
+                        get_model_semaphore(model).release()
+                except Exception as e:
+                    print(f"Error answering batch question {index}: {e}")
+                    return {"index": index, "question": query, "error": str(e)}
+                record_llm_response(response)
+        if answer_cache:
+            answer_cache.put(query, cache_key, query_embeddings[index], response)
+        result = timings.as_dict()
+        result["stages"] = {**shared_stages, **result["stages"]}
+        return item(index, response, result, cached=False)
+
+    tasks = [asyncio.create_task(answer(index, result)) for index, result in zip(pending, search_results)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
 def evaluate_relevance(question: str, answer: str, model: str) -> dict:
     prompt = build_evaluation_prompt(question, answer)
     print("Asking ollama for evaluation with prompt:", prompt)
-    ollama_host = f"http://{OLLAMA_HOST}:{OLLAMA_PORT}"
-    client = ollama.Client(host=ollama_host)
-    response = client.generate(
+    response = get_llm_router().generate(
         model=model,
-        prompt=prompt
+        system=EVALUATION_SYSTEM_PROMPT,
+        prompt=prompt,
+        **generate_options(model)
     )
     print("Evaluation response:", response.response)
     cleaned = clean_qwen_response(response.response)
@@ -83,3 +392,31 @@ def evaluate_relevance(question: str, answer: str, model: str) -> dict:
     except json.JSONDecodeError:
         result = {"Relevance": "UNKNOWN", "Explanation": "Failed to parse evaluation"}
         return result
+
+def evaluate_relevance_batch(items: list[tuple[str, str]], model: str) -> list[dict]:
+    """Evaluate several (question, answer) pairs with one generate call"""
+    if len(items) == 1:
+        return [evaluate_relevance(items[0][0], items[0][1], model)]
+    prompt = build_batch_evaluation_prompt(items)
+    print(f"Asking ollama for evaluation of {len(items)} answers")
+    response = get_llm_router().generate(
+        model=model,
+        system=BATCH_EVALUATION_SYSTEM_PROMPT,
+        prompt=prompt,
+        **generate_options(model)
+    )
+    cleaned = clean_qwen_response(response.response)
+    unknown = {"Relevance": "UNKNOWN", "Explanation": "Failed to parse evaluation"}
+    try:
+        evaluations = json.loads(cleaned.strip())
+    except json.JSONDecodeError:
+        return [dict(unknown) for _ in items]
+    if not isinstance(evaluations, list):
+        return [dict(unknown) for _ in items]
+    by_id = {}
+    for evaluation in evaluations:
+        try:
+            by_id[int(evaluation["Id"])] = evaluation
+        except (TypeError, KeyError, ValueError):
+            continue
+    return [by_id.get(i, dict(unknown)) for i in range(1, len(items) + 1)]
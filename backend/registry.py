@@ -0,0 +1,322 @@
+from .qdrant_connector import QdrantConnector, EmbeddingCache, storage_options_from_env
+from .qdrant_connector_hybrid import QdrantConnectorHybrid
+from .answer_cache import AnswerCache
+from .reranker import Reranker, CHARS_PER_TOKEN
+from .llm_router import OllamaRouter
+from .coalescing import RequestCoalescer
+import asyncio
+import json
+import os
+import threading
+from typing import Callable
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST")
+OLLAMA_PORT = os.getenv("OLLAMA_PORT")
+# pool of Ollama instances to route generations over, e.g. "ollama1:11434,ollama2:11434"
+OLLAMA_HOSTS = [
+    host.strip() for host in os.getenv("OLLAMA_HOSTS", f"{OLLAMA_HOST}:{OLLAMA_PORT}").split(",") if host.strip()
+]
+
+_lock = threading.Lock()
+# set once warm_up() finished, /readiness reports 503 until then
+_ready = threading.Event()
+_qdrant_connector: QdrantConnector | None = None
+_hybrid_connector: QdrantConnectorHybrid | None = None
+_llm_router: OllamaRouter | None = None
+_model_semaphores: dict[str, asyncio.Semaphore] = {}
+_answer_cache: AnswerCache | None = None
+_reranker: Reranker | None = None
+_request_coalescer: RequestCoalescer | None = None
+_tokenizers: dict[str, Callable[[str], int]] = {}
+# tokenizers load slowly, one lock per model family keeps them from blocking the other getters
+_tokenizers_lock = threading.Lock()
+_tokenizer_locks: dict[str, threading.Lock] = {}
+
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", 32))
+# default number of concurrent generations per model
+OLLAMA_MODEL_CONCURRENCY = int(os.getenv("OLLAMA_MODEL_CONCURRENCY", 2))
+# per model limits, e.g. "qwen3:1.7b=4,qwen3=1"
+OLLAMA_MODEL_CONCURRENCY_OVERRIDES = {
+    model.strip(): int(limit)
+    for model, limit in (
+        item.split("=") for item in os.getenv("OLLAMA_MODEL_CONCURRENCY_OVERRIDES", "").split(",") if "=" in item
+    )
+}
+
+def _keep_alive(value: str) -> str | int:
+    """Ollama takes a duration ("30m") or seconds, -1 keeps the model loaded forever"""
+    return int(value) if value.lstrip("-").isdigit() else value
+
+
+# how long Ollama keeps a model loaded after its last request, default and per model, e.g. "qwen3:1.7b=-1,qwen3=10m"
+OLLAMA_KEEP_ALIVE = _keep_alive(os.getenv("OLLAMA_KEEP_ALIVE", "30m"))
+OLLAMA_KEEP_ALIVE_OVERRIDES = {
+    model.strip(): _keep_alive(value.strip())
+    for model, value in (
+        item.split("=") for item in os.getenv("OLLAMA_KEEP_ALIVE_OVERRIDES", "").split(",") if "=" in item
+    )
+}
+# models loaded into Ollama at startup, e.g. "qwen3:1.7b,qwen3"
+OLLAMA_PRELOAD_MODELS = [model.strip() for model in os.getenv("OLLAMA_PRELOAD_MODELS", "").split(",") if model.strip()]
+# Ollama options for all models and per model, e.g. '{"qwen3": {"num_ctx": 8192, "num_thread": 8}}'
+OLLAMA_OPTIONS = {
+    name: int(value)
+    for name, value in (("num_ctx", os.getenv("OLLAMA_NUM_CTX")), ("num_thread", os.getenv("OLLAMA_NUM_THREAD")))
+    if value
+}
+OLLAMA_MODEL_OPTIONS: dict[str, dict] = json.loads(os.getenv("OLLAMA_MODEL_OPTIONS", "{}"))
+
+# tokens of retrieved context in the prompt, default and per model, e.g. "qwen3:1.7b=1000,qwen3=2000"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))
+CONTEXT_TOKEN_BUDGET_OVERRIDES = {
+    model.strip(): int(budget)
+    for model, budget in (
+        item.split("=") for item in os.getenv("CONTEXT_TOKEN_BUDGET_OVERRIDES", "").split(",") if "=" in item
+    )
+}
+# Hugging Face tokenizer per model family (the part of the Ollama model name before ":")
+MODEL_TOKENIZERS = {
+    "qwen3": "Qwen/Qwen3-0.6B",
+    **{
+        family.strip(): tokenizer.strip()
+        for family, tokenizer in (
+            item.split("=") for item in os.getenv("MODEL_TOKENIZERS", "").split(",") if "=" in item
+        )
+    },
+}
+
+# "dense" or "hybrid" (dense + BM25 with server-side fusion), can be overridden per request
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+# identical questions asked at the same time share one answer
+COALESCING_ENABLED = os.getenv("COALESCING_ENABLED", "true").lower() == "true"
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+# chunks retrieved from Qdrant when reranking is disabled
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", 5))
+
+
+def get_qdrant_connector() -> QdrantConnector:
+    """Return the process-wide QdrantConnector, creating it on first use"""
+    global _qdrant_connector
+    if _qdrant_connector is None:
+        with _lock:
+            if _qdrant_connector is None:
+                _qdrant_connector = QdrantConnector(
+                    qdrant_host=os.getenv("QDRANT_HOST", "localhost"),
+                    qdrant_port=int(os.getenv("QDRANT_PORT", 6333)),
+                    embedding_model=os.getenv(
+                        "EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+                    ),
+                    embedding_cache=EmbeddingCache(
+                        max_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+                        path=os.getenv("EMBEDDING_CACHE_PATH"),  # e.g. /app/data/query_embeddings.npz
+                    ),
+                    query_batch_max_size=int(os.getenv("QUERY_BATCH_MAX_SIZE", 32)),
+                    query_batch_max_wait=float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", 2)) / 1000,
+                    **storage_options_from_env(),
+                )
+    return _qdrant_connector
+
+
+def get_hybrid_connector() -> QdrantConnectorHybrid:
+    """Return the process-wide QdrantConnectorHybrid, creating it on first use"""
+    global _hybrid_connector
+    if _hybrid_connector is None:
+        with _lock:
+            if _hybrid_connector is None:
+                _hybrid_connector = QdrantConnectorHybrid(
+                    qdrant_host=os.getenv("QDRANT_HOST", "localhost"),
+                    qdrant_port=int(os.getenv("QDRANT_PORT", 6333)),
+                    embedding_model=os.getenv("HYBRID_EMBEDDING_MODEL", "jinaai/jina-embeddings-v2-small-en"),
+                    fusion=os.getenv("HYBRID_FUSION", "rrf"),
+                    dense_prefetch_limit=int(os.getenv("HYBRID_DENSE_PREFETCH", 20)),
+                    sparse_prefetch_limit=int(os.getenv("HYBRID_SPARSE_PREFETCH", 20)),
+                    embedding_cache=EmbeddingCache(
+                        max_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+                    ),
+                    qdrant_location=storage_options_from_env().get("qdrant_location"),
+                )
+    return _hybrid_connector
+
+
+def get_retriever(retrieval_mode: str | None = None) -> QdrantConnector | QdrantConnectorHybrid:
+    """Connector used for retrieval in given mode, RETRIEVAL_MODE by default"""
+    retrieval_mode = retrieval_mode or RETRIEVAL_MODE
+    if retrieval_mode == "dense":
+        return get_qdrant_connector()
+    if retrieval_mode == "hybrid":
+        return get_hybrid_connector()
+    raise ValueError(f"Unknown retrieval mode: {retrieval_mode}")
+
+
+def get_llm_router() -> OllamaRouter:
+    """Return the process-wide router over the Ollama instances (each with pooled HTTP connections)"""
+    global _llm_router
+    if _llm_router is None:
+        with _lock:
+            if _llm_router is None:
+                _llm_router = OllamaRouter(
+                    hosts=OLLAMA_HOSTS,
+                    max_connections=OLLAMA_MAX_CONNECTIONS,
+                    max_attempts=int(os.getenv("OLLAMA_MAX_ATTEMPTS", 2)),
+                    health_check_interval=float(os.getenv("OLLAMA_HEALTH_CHECK_INTERVAL", 10)),
+                )
+    return _llm_router
+
+
+def get_model_semaphore(model: str) -> asyncio.Semaphore:
+    """Semaphore limiting how many generations of given model run at once, the limit is per Ollama instance"""
+    if model not in _model_semaphores:
+        limit = OLLAMA_MODEL_CONCURRENCY_OVERRIDES.get(model, OLLAMA_MODEL_CONCURRENCY)
+        _model_semaphores[model] = asyncio.Semaphore(limit * len(OLLAMA_HOSTS))
+    return _model_semaphores[model]
+
+
+def generate_options(model: str) -> dict:
+    """
+    keep_alive and options for every generate call of the model. Answers, evaluations and the
+    preload all pass the same ones, as a different num_ctx makes Ollama reload the model.
+    """
+    options = {**OLLAMA_OPTIONS, **OLLAMA_MODEL_OPTIONS.get(model, {})}
+    return {
+        "keep_alive": OLLAMA_KEEP_ALIVE_OVERRIDES.get(model, OLLAMA_KEEP_ALIVE),
+        "options": options or None,
+    }
+
+
+def preload_models() -> None:
+    """Load OLLAMA_PRELOAD_MODELS into every Ollama instance"""
+    router = get_llm_router()
+    for model in OLLAMA_PRELOAD_MODELS:
+        router.preload(model, **generate_options(model))
+
+
+def get_context_budget(model: str) -> int:
+    return CONTEXT_TOKEN_BUDGET_OVERRIDES.get(model, CONTEXT_TOKEN_BUDGET)
+
+
+def get_token_counter(model: str) -> Callable[[str], int]:
+    """
+    Token counting function of the model's tokenizer, loaded once per model family.
+    Falls back to a characters based estimate when the tokenizer is unknown or can't be loaded.
+    """
+    family = model.split(":")[0]
+    if family not in _tokenizers:
+        with _tokenizers_lock:
+            family_lock = _tokenizer_locks.setdefault(family, threading.Lock())
+        with family_lock:
+            if family not in _tokenizers:
+                def estimate(text: str) -> int:
+                    return len(text) // CHARS_PER_TOKEN
+
+                if family not in MODEL_TOKENIZERS:
+                    counter = estimate
+                else:
+                    try:
+                        from transformers import AutoTokenizer
+                        tokenizer = AutoTokenizer.from_pretrained(MODEL_TOKENIZERS[family])
+
+                        def count_tokens(text: str) -> int:
+                            return len(tokenizer.encode(text, add_special_tokens=False))
+
+                        counter = count_tokens
+                    except Exception as e:
+                        print(f"Error loading tokenizer for {model}, estimating tokens from characters: {e}")
+                        counter = estimate
+                _tokenizers[family] = counter
+    return _tokenizers[family]
+
+
+def get_answer_cache() -> AnswerCache | None:
+    """Return the process-wide answer cache, None when it's disabled"""
+    global _answer_cache
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    if _answer_cache is None:
+        with _lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache(
+                    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000)),
+                    ttl=float(os.getenv("ANSWER_CACHE_TTL", 3600)),
+                    similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95)),
+                )
+    return _answer_cache
+
+
+def get_request_coalescer() -> RequestCoalescer | None:
+    """Return the process-wide request coalescer, None when coalescing is disabled"""
+    global _request_coalescer
+    if not COALESCING_ENABLED:
+        return None
+    if _request_coalescer is None:
+        with _lock:
+            if _request_coalescer is None:
+                _request_coalescer = RequestCoalescer()
+    return _request_coalescer
+
+
+def get_reranker() -> Reranker | None:
+    """Return the process-wide cross-encoder reranker, None when reranking is disabled"""
+    global _reranker
+    if not RERANK_ENABLED:
+        return None
+    if _reranker is None:
+        with _lock:
+            if _reranker is None:
+                _reranker = Reranker(
+                    model_name=os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+                    candidates=int(os.getenv("RERANK_CANDIDATES", 20)),
+                    top_k=int(os.getenv("RERANK_TOP_K", 5)),
+                    token_budget=int(os.getenv("RERANK_TOKEN_BUDGET", 1500)),
+                    batch_size=int(os.getenv("RERANK_BATCH_SIZE", 16)),
+                    max_cache_entries=int(os.getenv("RERANK_CACHE_ENTRIES", 10000)),
+                )
+    return _reranker
+
+
+def search_limit() -> int:
+    """How many chunks to fetch from Qdrant: the rerank candidates, or the final count without reranking"""
+    reranker = get_reranker()
+    return reranker.candidates if reranker else SEARCH_LIMIT
+
+
+def warm_up() -> None:
+    """Load the embedding model and the tokenizers, and run one encode so the first /ask doesn't pay for it"""
+    try:
+        connector = get_retriever()
+        connector.encode_query("warm up")
+        reranker = get_reranker()
+        if reranker:
+            reranker.model.predict([("warm up", "warm up")])
+        for family in MODEL_TOKENIZERS:
+            get_token_counter(family)
+        get_llm_router().check_health()
+        preload_models()
+        _ready.set()
+        print("Embedding model loaded and warmed up")
+    except Exception as e:
+        print(f"Error warming up models: {e}")
+
+
+def shut_down() -> None:
+    """Persist what should survive a restart"""
+    if _llm_router is not None:
+        _llm_router.stop()
+    for connector in (_qdrant_connector, _hybrid_connector):
+        if connector is not None and connector.embedding_cache is not None:
+            connector.embedding_cache.save()
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def status() -> dict:
+    connector = _hybrid_connector if RETRIEVAL_MODE == "hybrid" else _qdrant_connector
+    return {
+        "ready": is_ready(),
+        "retrieval_mode": RETRIEVAL_MODE,
+        "embedding_model_loaded": connector is not None,
+        "embedding_model": connector.embedding_model_name if connector else None,
+    }
@@ -0,0 +1,96 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from sentence_transformers import CrossEncoder
+
+# rough size of a token in characters, used for the context budget
+CHARS_PER_TOKEN = 4
+
+
+class Reranker:
+    """
+    Reranks search results with a local cross-encoder.
+
+    Search over-fetches `candidates` chunks, the cross-encoder scores (query, chunk) pairs in
+    batches and the best ones are kept: at most `top_k` and only as many as fit `token_budget`
+    (the first one is always kept). Scores are cached per (query, chunk text) in an LRU cache,
+    so repeated and overlapping questions only score new pairs.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        candidates: int = 20,
+        top_k: int = 5,
+        token_budget: int = 1500,
+        batch_size: int = 16,
+        max_cache_entries: int = 10000
+    ):
+        self.model = CrossEncoder(model_name)
+        self.model_name = model_name
+        self.candidates = candidates
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self.batch_size = batch_size
+        self.max_cache_entries = max_cache_entries
+        self._scores: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "batches": 0, "dropped_by_budget": 0}
+
+    @staticmethod
+    def _key(query: str, text: str) -> tuple[str, str]:
+        normalized_query = re.sub(r"\s+", " ", query).strip().lower()
+        return normalized_query, hashlib.sha1(text.encode()).hexdigest()
+
+    def score(self, query: str, texts: list[str]) -> list[float]:
+        """Cross-encoder relevance scores of texts for the query, computed only for uncached pairs"""
+        keys = [self._key(query, text) for text in texts]
+        scores: list[float | None] = []
+        with self._lock:
+            for key in keys:
+                score = self._scores.get(key)
+                if score is not None:
+                    self._scores.move_to_end(key)
+                scores.append(score)
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            predicted = self.model.predict([(query, texts[i]) for i in missing], batch_size=self.batch_size)
+            with self._lock:
+                for i, score in zip(missing, predicted):
+                    scores[i] = float(score)
+                    self._scores[keys[i]] = float(score)
+                while len(self._scores) > self.max_cache_entries:
+                    self._scores.popitem(last=False)
+                self.stats["batches"] += -(-len(missing) // self.batch_size)
+        with self._lock:
+            self.stats["hits"] += len(texts) - len(missing)
+            self.stats["misses"] += len(missing)
+        return scores
+
+    def rerank(self, query: str, results: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Sort results by rerank_score and keep the top ones that fit the token budget"""
+        if not results:
+            return results
+        scores = self.score(query, [result["text"] for result in results])
+        ranked = sorted(
+            ({**result, "rerank_score": score} for result, score in zip(results, scores)),
+            key=lambda result: result["rerank_score"],
+            reverse=True
+        )
+        kept, tokens = [], 0
+        for result in ranked[:self.top_k]:
+            result_tokens = len(result["text"]) // CHARS_PER_TOKEN
+            if kept and tokens + result_tokens > self.token_budget:
+                continue
+            kept.append(result)
+            tokens += result_tokens
+        with self._lock:
+            self.stats["dropped_by_budget"] += min(len(ranked), self.top_k) - len(kept)
+        return kept
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, "entries": len(self._scores), "model": self.model_name}
@@ -4,7 +4,31 @@ CREATE TABLE IF NOT EXISTS conversations (
                     answer TEXT NOT NULL,
                     model_used TEXT NOT NULL,
                     response_time FLOAT NOT NULL,
+                    first_token_time FLOAT,
                     relevance TEXT NOT NULL,
                     relevance_explanation TEXT NOT NULL,
                     timestamp TIMESTAMP WITH TIME ZONE NOT NULL
-                );
\ No newline at end of file
+                );
+
+CREATE TABLE IF NOT EXISTS stage_timings (
+                    conversation_id TEXT NOT NULL REFERENCES conversations(id),
+                    model_used TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    duration FLOAT NOT NULL,
+                    timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+                    PRIMARY KEY (conversation_id, stage)
+                );
+
+CREATE INDEX IF NOT EXISTS stage_timings_timestamp_idx ON stage_timings (timestamp);
+
+CREATE TABLE IF NOT EXISTS llm_stats (
+                    conversation_id TEXT PRIMARY KEY REFERENCES conversations(id),
+                    model_used TEXT NOT NULL,
+                    load_duration FLOAT,
+                    prompt_eval_duration FLOAT,
+                    eval_duration FLOAT,
+                    prompt_eval_count INTEGER,
+                    eval_count INTEGER,
+                    tokens_per_second FLOAT,
+                    timestamp TIMESTAMP WITH TIME ZONE NOT NULL
+                );
@@ -158,50 +158,42 @@ st.markdown("""
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-def call_backend_api(prompt, model="qwen3"):
+def call_backend_api_stream(prompt, model="qwen3"):
     """
-    Call backend API with the prompt
+    Call the streaming backend endpoint and yield answer tokens as they arrive
     """
+    backend_url = "http://backend:8000"
+    payload = {
+        "model": model,
+        "text": prompt
+    }
     try:
-        # Backend API endpoint
-        backend_url = "http://backend:8000"
-        
-        # Prepare payload
-        payload = {
-            "model": model,
-            "text": prompt
-        }
-        
-        # Make POST request
-        response = requests.post(
-            f"{backend_url}/ask",
+        with requests.post(
+            f"{backend_url}/ask/stream",
             json=payload,
             headers={"Content-Type": "application/json"},
-            timeout=360  # 360 second timeout
-        )
-        
-        # Check if request was successful
-        if response.status_code == 200:
-            try:
-                result = response.json()
-                # Handle different possible response formats
-                if isinstance(result, dict):
-                    return result.get('response', result.get('text', str(result)))
-                else:
-                    return str(result)
-            except json.JSONDecodeError:
-                return response.text
-        else:
-            return f"Error: Backend returned status code {response.status_code}"
-            
+            stream=True,
+            timeout=(5, 360)  # connect timeout, max wait between tokens
+        ) as response:
+            if response.status_code != 200:
+                yield f"Error: Backend returned status code {response.status_code}"
+                return
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                message = json.loads(line)
+                if "token" in message:
+                    yield message["token"]
+                elif "error" in message:
+                    yield f"Error: {message['error']}"
     except requests.exceptions.ConnectionError:
-        return "Error: Could not connect to backend service. Please make sure the backend is running."
+        yield "Error: Could not connect to backend service. Please make sure the backend is running."
     except requests.exceptions.Timeout:
-        return "Error: Request timed out. The backend might be processing a heavy task."
+        yield "Error: Request timed out. The backend might be processing a heavy task."
     except requests.exceptions.RequestException as e:
-        return f"Error: Request failed - {str(e)}"
+        yield f"Error: Request failed - {str(e)}"
     except Exception as e:
-        return f"Error: Unexpected error - {str(e)}"
+        yield f"Error: Unexpected error - {str(e)}"
 
 def main():
     # Simple header
@@ -264,17 +256,17 @@ def main():
         
         # Generate and display assistant response
         with st.chat_message("assistant"):
-            with st.spinner("Processing..."):
-                no_think_prompt = f"nothink/ {prompt}"
-                response = call_backend_api(no_think_prompt, model)
+            no_think_prompt = f"nothink/ {prompt}"
+            # tokens are rendered as they arrive, <think> blocks are already removed by the backend
+            response = st.write_stream(call_backend_api_stream(no_think_prompt, model))
+            if not isinstance(response, str):
+                response = "".join(str(part) for part in response)
             
             # Check if response is an error
-            is_error = isinstance(response, str) and response.startswith("Error:")
+            is_error = response.startswith("Error:")
             
             if is_error:
                 st.markdown(f'<div class="error-message">{response}</div>', unsafe_allow_html=True)
-            else:
-                st.markdown(response.replace("</think>\n", "").replace("<think>\n", ""))
             
             timestamp = datetime.now().strftime("%H:%M")
             st.caption(f"Qwen3 • {timestamp}")
@@ -0,0 +1,29 @@
+import asyncio
+
+from backend import metrics
+from backend.coalescing import RequestCoalescer
+
+
+def test_only_the_request_computing_the_answer_is_not_coalesced():
+    coalescer = RequestCoalescer()
+    computed = 0
+
+    async def compute():
+        nonlocal computed
+        computed += 1
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def ask():
+        with metrics.track_request("model") as timings:
+            key = coalescer.key("What is it?", "model", None)
+            result = await asyncio.create_task(coalescer.run(key, compute))
+        return result, timings.coalesced
+
+    async def main():
+        return await asyncio.gather(*(ask() for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert computed == 1
+    assert [result for result, _ in results] == ["answer"] * 3
+    assert sorted(coalesced for _, coalesced in results) == [False, True, True]
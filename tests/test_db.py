@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from backend import db  # noqa: E402
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    """Rows written by save_conversations, which fails for batches with a "bad" record or while down > 0"""
+    rows = []
+    state = {"down": 0}
+
+    def save_conversations(records):
+        if state["down"]:
+            state["down"] -= 1
+            raise ConnectionError("database restarting")
+        if any(record["conversation"] == "bad" for record in records):
+            raise ValueError("constraint violated")
+        rows.extend(record["conversation"] for record in records)
+
+    monkeypatch.setattr(db, "save_conversations", save_conversations)
+    monkeypatch.setattr(db, "sleep", lambda seconds: None)
+    return rows, state
+
+
+def test_flush_retries_a_failed_batch(saved):
+    rows, state = saved
+    state["down"] = 2
+    logger = db.ConversationLogger(max_retries=3)
+    logger._flush([{"conversation": "a"}, {"conversation": "b"}])
+    logger.stop(timeout=5)
+    assert rows == ["a", "b"]
+    assert logger.stats["written"] == 2 and logger.stats["failed"] == 0
+
+
+def test_flush_drops_only_the_bad_row(saved):
+    rows, _ = saved
+    logger = db.ConversationLogger(max_retries=2)
+    logger._flush([{"conversation": "a"}, {"conversation": "bad"}, {"conversation": "c"}])
+    logger.stop(timeout=5)
+    assert rows == ["a", "c"]
+    assert logger.stats["written"] == 2 and logger.stats["failed"] == 1
@@ -0,0 +1,38 @@
+import time
+
+import pytest
+
+pytest.importorskip("ollama")
+pytest.importorskip("psycopg2")
+
+from backend import evaluation  # noqa: E402
+from backend.evaluation import EvaluationScheduler  # noqa: E402
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    """Relevance of every saved answer, evaluations always come back RELEVANT"""
+    relevance = {}
+
+    def evaluate_relevance_batch(pairs, model):
+        return [{"Relevance": "RELEVANT", "Explanation": "ok"} for _ in pairs]
+
+    def save(job, result):
+        relevance[job["query"]] = result["Relevance"]
+
+    monkeypatch.setattr(evaluation, "evaluate_relevance_batch", evaluate_relevance_batch)
+    monkeypatch.setattr(EvaluationScheduler, "_save", staticmethod(save))
+    return relevance
+
+
+def test_answers_submitted_without_evaluation_are_only_saved(saved):
+    scheduler = EvaluationScheduler(queue_path=None, max_defer=0)
+    scheduler.submit("generated", "answer", "model", 1.0)
+    scheduler.submit("cached", "answer", "model", 0.1, evaluate=False)
+    # stop() leaves queued jobs for the next start, so wait for the evaluation first
+    deadline = time.monotonic() + 5
+    while not scheduler.stats["evaluated"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    scheduler.stop(timeout=5)
+    assert saved == {"generated": "RELEVANT", "cached": "NOT_EVALUATED"}
+    assert scheduler.stats["evaluated"] == 1 and scheduler.stats["not_evaluated"] == 1
@@ -0,0 +1,42 @@
+import json
+
+from backend.ingest_manifest import IngestManifest
+
+SETTINGS = {"embedding_model": "model", "chunk_size": 800}
+
+
+def write_manifest(path, settings, files):
+    path.write_text(json.dumps({"settings": settings, "files": files}))
+
+
+def test_tags_are_tracked_per_file(tmp_path):
+    path = tmp_path / "manifest.json"
+    manifest = IngestManifest(path, SETTINGS)
+    manifest.update("a.pdf", "sha-a", 3, IngestManifest.tags_hash(["x", "y"]))
+    manifest.save()
+
+    manifest = IngestManifest(path, SETTINGS)
+    assert not manifest.settings_changed
+    assert manifest.has_filter_fields("a.pdf")
+    assert not manifest.tags_changed("a.pdf", IngestManifest.tags_hash(["y", "x"]))
+    assert manifest.tags_changed("a.pdf", IngestManifest.tags_hash(["x"]))
+
+
+def test_tags_in_legacy_settings_move_to_the_files(tmp_path):
+    path = tmp_path / "manifest.json"
+    files = {"a.pdf": {"sha256": "sha-a", "chunks": 3}, "b.pdf": {"sha256": "sha-b", "chunks": 1}}
+    write_manifest(path, {**SETTINGS, "tags": {"a.pdf": ["x"]}}, files)
+
+    manifest = IngestManifest(path, SETTINGS)
+    assert not manifest.settings_changed
+    assert not manifest.tags_changed("a.pdf", IngestManifest.tags_hash(["x"]))
+    assert not manifest.tags_changed("b.pdf", IngestManifest.tags_hash([]))
+
+
+def test_files_ingested_before_filter_fields_are_flagged(tmp_path):
+    path = tmp_path / "manifest.json"
+    write_manifest(path, SETTINGS, {"a.pdf": {"sha256": "sha-a", "chunks": 3}})
+
+    manifest = IngestManifest(path, SETTINGS)
+    assert manifest.is_up_to_date("a.pdf", "sha-a")
+    assert not manifest.has_filter_fields("a.pdf")
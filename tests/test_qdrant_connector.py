@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("qdrant_client")
+pytest.importorskip("fastembed")
+pytest.importorskip("sentence_transformers")
+
+from backend import qdrant_connector, qdrant_connector_hybrid  # noqa: E402
+from backend.qdrant_connector import QdrantConnector  # noqa: E402
+from backend.qdrant_connector_hybrid import QdrantConnectorHybrid  # noqa: E402
+
+
+def embed(text: str) -> np.ndarray:
+    """Tiny deterministic embedding, so no model has to be downloaded"""
+    return np.array([len(text), text.count("a"), text.count("e"), 1.0], dtype=np.float32)
+
+
+class FakeSentenceTransformer:
+    def __init__(self, model_name: str):
+        pass
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return 4
+
+    def encode(self, texts, batch_size: int = 32, convert_to_numpy: bool = True):
+        return np.stack([embed(text) for text in texts])
+
+
+class FakeTextEmbedding:
+    def __init__(self, model_name: str):
+        pass
+
+    def embed(self, texts, batch_size: int = 64):
+        return (embed(text) for text in texts)
+
+    def query_embed(self, query, batch_size: int = 64):
+        return self.embed([query] if isinstance(query, str) else query)
+
+
+class FakeSparseTextEmbedding(FakeTextEmbedding):
+    def embed(self, texts, batch_size: int = 64):
+        return (SimpleNamespace(indices=np.array([len(text)]), values=np.array([1.0])) for text in texts)
+
+
+@pytest.fixture(autouse=True)
+def fake_models(monkeypatch):
+    monkeypatch.setattr(qdrant_connector, "SentenceTransformer", FakeSentenceTransformer)
+    monkeypatch.setattr(qdrant_connector_hybrid, "TextEmbedding", FakeTextEmbedding)
+    monkeypatch.setattr(qdrant_connector_hybrid, "SparseTextEmbedding", FakeSparseTextEmbedding)
+
+
+def test_dense_and_hybrid_connectors_share_an_embedded_qdrant_path(tmp_path):
+    dense = QdrantConnector(qdrant_location=str(tmp_path))
+    hybrid = QdrantConnectorHybrid(qdrant_location=str(tmp_path))
+    assert dense.qdrant_client is hybrid.qdrant_client
+
+    for connector in (dense, hybrid):
+        connector.recreate_collection()
+        assert connector.upload_chunks([{"text": "alpha"}, {"text": "beta gamma delta"}], {"file_name": "a.pdf"}) == 2
+    assert dense.search_similar("alpha", limit=1)[0]["text"] == "alpha"
+    assert hybrid.search_similar("alpha", limit=1)[0]["file_name"] == "a.pdf"
+    assert len(dense.scroll_payloads()) == len(hybrid.scroll_payloads()) == 2
+
+
+@pytest.mark.parametrize("storage", ["qdrant_location", "vector_index_path"])
+def test_set_file_tags_updates_only_that_file(tmp_path, storage):
+    connector = QdrantConnector(**{storage: str(tmp_path)})
+    connector.recreate_collection()
+    connector.upload_chunks([{"text": "alpha"}], {"file_name": "a.pdf", "tags": ["old"]})
+    connector.upload_chunks([{"text": "beta"}], {"file_name": "b.pdf", "tags": ["old"]})
+    connector.set_file_tags("a.pdf", ["new"])
+    tags = {payload["file_name"]: payload["tags"] for payload in connector.scroll_payloads()}
+    assert tags == {"a.pdf": ["new"], "b.pdf": ["old"]}
+
+
+def test_embedding_cache_round_trip_without_npz_suffix(tmp_path):
+    path = tmp_path / "query_embeddings"
+    cache = qdrant_connector.EmbeddingCache(path=str(path))
+    cache.put("model", "What is it?", np.arange(4, dtype=np.float32))
+    cache.save()
+    assert path.exists() and not (tmp_path / "query_embeddings.npz").exists()
+
+    restored = qdrant_connector.EmbeddingCache(path=str(path))
+    np.testing.assert_array_equal(restored.get("model", "What  is it?"), np.arange(4, dtype=np.float32))